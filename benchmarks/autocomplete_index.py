@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import schema  # noqa: E402
+import database  # noqa: E402
+
+WORDS = ["the", "dark", "knight", "return", "of", "avatar", "water", "star", "wars", "empire", "night", "city",
+         "lost", "world", "planet", "storm", "garden", "ghost", "house", "dragon", "river", "shadow", "king"]
+LIKE_QUERY = '''
+        SELECT simklID, title
+        FROM movies
+        WHERE guildID = 1
+        AND LOWER(title) LIKE ?
+        AND watchedAt = 0
+        LIMIT 25;
+    '''
+
+
+def populate(rows: int) -> None:
+    rng = random.Random(0)
+    schema.migrate()
+    database.commit_many(
+        '''
+            INSERT INTO movies (guildID, simklID, imdbID, title, isReleased, releaseTime, runtime, rating, addedAt,
+                                userName, userID, watchedAt)
+            VALUES (1, ?, 'tt0', ?, 1, 0, 90, 7.0, ?, 'user', ?, ?);
+        ''',
+        [(i, " ".join(rng.choices(WORDS, k=rng.randint(1, 4))) + f" {i}", i, i % 20, i % 3) for i in range(rows)]
+    )
+
+
+def time_query(run, searches: list[str], repeat: int) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        for search_string in searches:
+            start = time.perf_counter()
+            run(search_string)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main(rows: int, repeat: int):
+    searches = ["avatar water", "knight 99", "shadow king 4", "dragon", "zzz"]
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+        populate(rows)
+
+        like = time_query(lambda s: database.execute_query(LIKE_QUERY, (f"%{s}%",)), searches, repeat)
+        indexed = time_query(lambda s: database.search_to_watch_titles("movies", 1, s), searches, repeat)
+        database.close()
+
+    print(f"{rows} rows, {len(searches)} searches x {repeat}")
+    for label, timings in (("LIKE scan", like), ("FTS5", indexed)):
+        print(f"{label:<10} mean {statistics.mean(timings):8.3f} ms   p50 {statistics.median(timings):8.3f} ms   "
+              f"max {max(timings):8.3f} ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="LIKE scan versus the FTS5 trigram index for list autocomplete")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    main(args.rows, args.repeat)
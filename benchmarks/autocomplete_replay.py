@@ -0,0 +1,152 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import functools
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import simkl  # noqa: E402
+import database  # noqa: E402
+import async_database as db  # noqa: E402
+from cache import SearchCache  # noqa: E402
+from fake_simkl import Faults, start_fake_simkl, search_catalogue  # noqa: E402
+
+WORDS = ["the", "dark", "knight", "return", "of", "avatar", "water", "star", "wars", "empire", "night", "city",
+         "lost", "world", "planet", "storm", "garden", "ghost", "house", "dragon", "river", "shadow", "king"]
+
+
+###########################################
+# ---------------) Traces (---------------#
+###########################################
+
+def build_catalogue(size: int, rng: random.Random) -> list[dict]:
+    # Roughly one in ten Simkl results has no year and is dropped from the choices
+    return [
+        {"title": " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title() + f" {i}",
+         "year": 0 if rng.random() < 0.1 else rng.randint(1950, 2025), "ids": {"simkl_id": i}}
+        for i in range(1, size + 1)
+    ]
+
+
+def build_traces(catalogue: list[dict], count: int, users: int, rng: random.Random) -> list[tuple[int, list[str]]]:
+    # Popular titles are typed far more often (Zipf), and most users stop typing once the title shows up
+    weights = [1 / rank for rank in range(1, len(catalogue) + 1)]
+    traces = []
+    for target in rng.choices(catalogue, weights=weights, k=count):
+        query = target["title"].lower()
+        stop = rng.randint(min(len(query), 4), len(query))
+        traces.append((rng.randrange(users), [query[:end] for end in range(2, stop + 1)]))
+    return traces
+
+
+def ground_truth(catalogue: list[dict]):
+    # What an uncached search would have shown for the query, used to score refined answers
+    @functools.cache
+    def expected(query: str) -> tuple[int, ...]:
+        return tuple(entry["ids"]["simkl_id"] for entry in search_catalogue(catalogue, query, simkl.SEARCH_LIMIT)
+                     if entry["year"])[:simkl.MAX_CHOICES]
+
+    return expected
+
+
+###########################################
+# ---------------) Replay (---------------#
+###########################################
+
+async def replay(expected, traces: list[tuple[int, list[str]]], refinement: bool, gap: float) -> dict:
+    simkl.PREFIX_REFINEMENT = refinement
+    simkl.search_cache = SearchCache()
+    simkl.search_counters.update(dict.fromkeys(simkl.search_counters, 0))
+    # Recall against an uncached search, split by how the keystroke was answered
+    recall: dict[str, list[float]] = {"exact": [0, 0.0], "covered": [0, 0.0], "verifying": [0, 0.0]}
+    top_matches = 0
+    latencies = []
+
+    for user_id, keystroke_queries in traces:
+        for query in keystroke_queries:
+            refined, verifying = simkl.search_counters["refined"], simkl.search_counters["refined_upstream"]
+            start = time.perf_counter()
+            choices = await simkl.search("movies", query, user_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            kind = "exact" if simkl.search_counters["refined"] == refined else \
+                "verifying" if simkl.search_counters["refined_upstream"] != verifying else "covered"
+            truth = expected(query)
+            answered = [choice["value"] for choice in choices or []]
+            recall[kind][0] += 1
+            recall[kind][1] += len(set(truth) & set(answered)) / len(truth) if truth else float(not answered)
+            top_matches += tuple(answered[:1]) == truth[:1]
+            await asyncio.sleep(gap)
+
+        # Background refreshes from this trace land before the next user starts typing
+        await asyncio.gather(*list(simkl.inflight_searches.values()), return_exceptions=True)
+
+    latencies.sort()
+    keystrokes = len(latencies)
+    return {
+        "keystrokes": keystrokes,
+        "upstream": simkl.search_counters["upstream"],
+        "recall": {kind: (count, total / count if count else 0.0) for kind, (count, total) in recall.items()},
+        "top_match": top_matches / keystrokes,
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+    }
+
+
+def report(label: str, result: dict) -> None:
+    recall = ", ".join(f"{kind} {count} @ {value:.1%}" for kind, (count, value) in result["recall"].items() if count)
+    print(f"{label:<8} {result['keystrokes']} keystrokes, {result['upstream']} upstream "
+          f"({result['upstream'] / result['keystrokes']:.2f}/keystroke), top match {result['top_match']:.1%}, "
+          f"p50 {result['p50_ms']:.2f} ms, p95 {result['p95_ms']:.2f} ms")
+    print(f"{'':<8} recall by answer: {recall}")
+
+
+async def main(traces_count: int, users: int, catalogue_size: int, latency: float, gap: float, port: int,
+               seed: int) -> int:
+    rng = random.Random(seed)
+    catalogue = build_catalogue(catalogue_size, rng)
+    traces = build_traces(catalogue, traces_count, users, rng)
+
+    runner = await start_fake_simkl(port, Faults(latency=latency), catalogue)
+    simkl.client = simkl.SimklClient(base_url=f"http://127.0.0.1:{port}", rate=1e9, burst=10_000)
+    await simkl.client.start()
+
+    expected = ground_truth(catalogue)
+    results = {}
+    try:
+        for label, refinement in (("exact", False), ("refined", True)):
+            with tempfile.TemporaryDirectory() as directory:
+                database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+                await db.initialize()
+                results[label] = await replay(expected, traces, refinement, gap)
+                database.close()
+            report(label, results[label])
+    finally:
+        await simkl.client.close()
+        await runner.cleanup()
+        db.close()
+
+    saved = 1 - results["refined"]["upstream"] / results["exact"]["upstream"]
+    verifying_count, verifying_recall = results["refined"]["recall"]["verifying"]
+    print(f"Prefix refinement saved {saved:.1%} of upstream searches; the {verifying_count} answers shown before "
+          f"Simkl confirmed them recalled {verifying_recall:.1%} of its results")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay /add keystroke traces and count upstream Simkl searches")
+    parser.add_argument("--traces", type=int, default=50)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--catalogue", type=int, default=5_000)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake Simkl takes per search")
+    parser.add_argument("--gap", type=float, default=0.025, help="Seconds between keystrokes")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.traces, args.users, args.catalogue, args.latency, args.gap, args.port,
+                              args.seed)))
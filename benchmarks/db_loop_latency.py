@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import database  # noqa: E402
+import async_database  # noqa: E402
+
+LONG_WRITE = '''
+        WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?)
+        INSERT INTO filler (value) SELECT hex(randomblob(64)) FROM n;
+    '''
+
+
+async def max_loop_lag(work, interval: float = 0.005) -> tuple[float, float]:
+    lag = 0.0
+    done = asyncio.Event()
+
+    async def ticker():
+        nonlocal lag
+        loop = asyncio.get_running_loop()
+        while not done.is_set():
+            expected = loop.time() + interval
+            await asyncio.sleep(interval)
+            lag = max(lag, loop.time() - expected)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(interval * 2)
+    start = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - start
+    done.set()
+    await task
+    return elapsed * 1000, lag * 1000
+
+
+async def main(rows: int):
+    with tempfile.TemporaryDirectory() as directory:
+        database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+        database.commit_query("CREATE TABLE filler (value TEXT);")
+
+        async def blocking_write():
+            database.commit_query(LONG_WRITE, (rows,))
+
+        async def executor_write():
+            await async_database.commit_query(LONG_WRITE, (rows,))
+
+        for label, work in (("sync", blocking_write), ("async", executor_write)):
+            elapsed, lag = await max_loop_lag(work)
+            print(f"{label:<6} write {elapsed:8.1f} ms   worst loop stall {lag:8.1f} ms")
+
+        async_database.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Event loop stalls while a long SQLite write runs")
+    parser.add_argument("--rows", type=int, default=300_000)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows))
@@ -0,0 +1,84 @@
+import random
+import asyncio
+
+from aiohttp import web
+
+MOVIE_PAYLOAD = {
+    "title": "Avatar",
+    "year": 2009,
+    "ids": {"simkl": 1, "imdb": "tt0499549"},
+    "runtime": 162,
+    "released": "2009-12-18",
+    "director": "James Cameron",
+    "budget": 237000000,
+    "revenue": 2923706026,
+}
+
+
+###########################################
+# ------------) Fake Simkl (--------------#
+###########################################
+
+class Faults:
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.2, down: bool = False, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.down = down
+        self.rng = random.Random(seed)
+        self.hits = 0
+
+    async def inject(self) -> web.Response | None:
+        self.hits += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.down or self.rng.random() < self.error_rate:
+            return web.Response(status=503)
+        if self.rng.random() < self.rate_limit_rate:
+            return web.Response(status=429, headers={"Retry-After": str(self.retry_after)})
+        return None
+
+
+def search_catalogue(catalogue: list[dict], query: str, limit: int) -> list[dict]:
+    # Deliberately not the word-prefix rule simkl.refine() uses: typed words may match anywhere inside a title
+    # word, and titles rank by how many typed words they contain whole, then by catalogue (popularity) order.
+    # Replays then measure how far refined answers drift from a search engine that is not refine() itself
+    tokens = query.lower().split()
+    matches = []
+    for position, entry in enumerate(catalogue):
+        words = entry["title"].lower().split()
+        if all(any(token in word for word in words) for token in tokens):
+            matches.append((-sum(token in words for token in tokens), position, entry))
+    return [entry for *_, entry in sorted(matches)[:limit]]
+
+
+async def start_fake_simkl(port: int, faults: Faults | None = None,
+                           catalogue: list[dict] | None = None) -> web.AppRunner:
+    faults = faults or Faults()
+
+    async def search(request):
+        failure = await faults.inject()
+        if failure is not None:
+            return failure
+        if catalogue is None:
+            return web.json_response([{"title": "Avatar", "year": 2009, "ids": {"simkl_id": 1}}])
+        return web.json_response(search_catalogue(catalogue, request.query.get("q", ""),
+                                                  int(request.query.get("limit", 10))))
+
+    async def movie(request):
+        failure = await faults.inject()
+        if failure is not None:
+            return failure
+        return web.json_response({**MOVIE_PAYLOAD, "ids": {**MOVIE_PAYLOAD["ids"],
+                                                           "simkl": int(request.match_info["simkl_id"])}})
+
+    app = web.Application()
+    app.router.add_get("/search/{media_type}", search)
+    app.router.add_get("/movies/{simkl_id}", movie)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
@@ -0,0 +1,127 @@
+import os
+import re
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import schema  # noqa: E402
+import database  # noqa: E402
+from validation import Movie  # noqa: E402
+
+MOVIE = Movie.model_validate({
+    "title": "Avatar", "ids": {"simkl": 1, "imdb": "tt0499549"}, "runtime": 162, "released": "2009-12-18",
+    "director": "James Cameron", "budget": None, "revenue": None, "genres": ["Action"],
+})
+# Loaders that intentionally read every row once at startup or maintenance time
+FULL_SCANS = {"get_index_rows", "get_view_rows", "prune_payloads", "get_list_messages",
+              "get_missing_details", "get_popular_searches", "get_search_bytes",
+              "prune_searches"}
+CALLS = [
+    ("entry_exists", ("movies", 1, 1)),
+    ("get_unreleased_ids", ("movies", 1)),
+    ("get_unreleased_entries", ("movies", 1)),
+    ("update_entry", ("movies", 1, MOVIE)),
+    ("update_entries", ("movies", 1, [(1, MOVIE)])),
+    ("get_owned_entries", ("movies", 1, "avatar", 1)),
+    ("get_owned_entries", ("movies", 1, "av", 1)),
+    ("remove_entry", ("movies", 1, 1, 1)),
+    ("insert", (MOVIE, 1, "user", 1)),
+    ("get_to_watch_data", ("movies", 1)),
+    ("search_to_watch_titles", ("movies", 1, "avatar")),
+    ("search_to_watch_titles", ("movies", 1, "av")),
+    ("search_known_titles", ("movies", 1, "avatar")),
+    ("select_random_simkl_id", ("movies", 1)),
+    ("select_random_simkl_id", ("movies", 1, 120, 7.0, 1, "Action")),
+    ("get_to_watch_owner_data", ("movies", 1, 1)),
+    ("set_watched", ("movies", 1, 1)),
+    ("get_watched_data", ("movies", 1)),
+    ("get_genres", ("movies", 1, "act")),
+    ("get_cached_payload", ("movies", 1)),
+    ("store_payload", ("movies", 1, "{}", 0)),
+    ("prune_payloads", (0,)),
+    ("get_index_rows", ("movies",)),
+    ("get_view_rows", ("movies",)),
+    ("get_view_row", ("movies", 1, 1)),
+    ("register_list_message", (1, "to_watch", 1, 1)),
+    ("get_due_refreshes", ("movies", 0, 40)),
+    ("get_refresh_queue", ("movies", 1, 10)),
+    ("reschedule", ("movies", [(0, 1, 1)])),
+    ("store_details", ([MOVIE],)),
+    ("get_details", ("movies", 1, 1)),
+    ("get_missing_details", ("movies", 0, 40)),
+    ("store_search", ("avatar_movie", b"[]", 0, True)),
+    ("get_search", ("avatar_movie",)),
+    ("record_search_usage", ([(1, 0, "avatar_movie")],)),
+    ("get_popular_searches", (0, 1 << 20, 0)),
+    ("get_search_bytes", ()),
+    ("prune_searches", (0, 16 << 20, 0)),
+]
+# Ranked autocomplete sorts its (small) match set; everything else must take its order from an index
+SORTED = {"get_owned_entries", "search_to_watch_titles", "search_known_titles", "get_genres"}
+# Any SCAN of a stored table counts, covering-index scans included; FTS5 lookups show up as VIRTUAL TABLE
+TABLE_SCAN = re.compile(r"^SCAN (\w+)\b(?! VIRTUAL TABLE)")
+
+
+def stored_tables() -> set[str]:
+    with database.manager.reader() as db:
+        return {name for name, in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql NOT LIKE 'CREATE VIRTUAL TABLE%';")}
+
+def explain(query: str, params) -> list[str]:
+    with database.manager.reader() as db:
+        return [detail for *_, detail in db.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()]
+
+
+def main() -> int:
+    plans: list[tuple[str, str, list[str]]] = []
+    current = ""
+
+    def recorder(original):
+        def wrapper(query, params=(), *args):
+            first = params[0] if params and isinstance(params, list) else params
+            plans.append((current, " ".join(query.split()), explain(query, first)))
+            return original(query, params, *args)
+
+        return wrapper
+
+    def batch_recorder(original):
+        def wrapper(statements):
+            for query, params_seq in statements:
+                if params_seq:
+                    plans.append((current, " ".join(query.split()), explain(query, params_seq[0])))
+            return original(statements)
+
+        return wrapper
+
+    database.execute_query = recorder(database.execute_query)
+    database.commit_query = recorder(database.commit_query)
+    database.commit_many = recorder(database.commit_many)
+    database.commit_batch = batch_recorder(database.commit_batch)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+        schema.migrate()
+
+        for current, args in CALLS:
+            getattr(database, current)(*args)
+
+        tables = stored_tables()
+        for function, query, plan in plans:
+            scans = [] if function in FULL_SCANS else \
+                [line for line in plan if (match := TABLE_SCAN.match(line)) and match.group(1) in tables]
+            if function not in SORTED | FULL_SCANS:
+                scans += [line for line in plan if line.startswith("USE TEMP B-TREE")]
+            failures += bool(scans)
+            print(f"{'SCAN' if scans else 'ok':<5} {function}: {query[:90]}")
+            for line in plan:
+                print(f"        {line}")
+
+        database.close()
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import simkl  # noqa: E402
+import database  # noqa: E402
+import async_database as db  # noqa: E402
+from cache import DetailCache, SearchCache  # noqa: E402
+from resilience import CircuitBreaker, within_deadline  # noqa: E402
+from fake_simkl import Faults, start_fake_simkl  # noqa: E402
+
+
+###########################################
+# -------------) Scenarios (--------------#
+###########################################
+
+async def flaky(client: simkl.SimklClient, faults: Faults, count: int) -> bool:
+    faults.error_rate, faults.rate_limit_rate = 0.2, 0.05
+    timings, failures = [], 0
+
+    async def request(simkl_id: int):
+        nonlocal failures
+        start = time.perf_counter()
+        try:
+            await client.get(f"/movies/{simkl_id}")
+        except simkl.SimklUnavailable:
+            failures += 1
+        timings.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(request(simkl_id) for simkl_id in range(count)))
+    faults.error_rate, faults.rate_limit_rate = 0.0, 0.0
+
+    timings.sort()
+    print(f"flaky     {count} requests, {failures} failed, p50 {statistics.median(timings):.1f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95) - 1]:.1f} ms, {client.stats()}")
+    return failures <= count * 0.01
+
+
+async def outage(client: simkl.SimklClient, faults: Faults) -> bool:
+    # Prime the detail cache, then let it expire so only the outage fallback can answer
+    await simkl.id_to_object("movies", 1)
+    simkl.detail_cache.ttl = simkl.detail_cache.stale_ttl = -1
+
+    faults.down = True
+    hits = faults.hits
+    media = [await simkl.id_to_object("movies", 1) for _ in range(20)]
+    upstream = faults.hits - hits
+
+    print(f"outage    served {sum(m is not None for m in media)}/20 from cache, {upstream} upstream attempts, "
+          f"breaker {client.breaker.state}, {simkl.detail_cache.stats()}")
+    return all(media) and client.breaker.state == CircuitBreaker.OPEN and upstream <= client.breaker.failure_threshold
+
+
+async def recovery(client: simkl.SimklClient, faults: Faults) -> bool:
+    faults.down = False
+    await asyncio.sleep(client.breaker.reset_timeout)
+    payload = await client.get("/movies/2")
+
+    print(f"recovery  payload {'ok' if payload else 'missing'}, breaker {client.breaker.state}")
+    return bool(payload) and client.breaker.state == CircuitBreaker.CLOSED
+
+
+async def deadline(faults: Faults) -> bool:
+    # Simkl slower than the budget: the fallback answers in time and the late result still fills the cache
+    faults.latency = 1.0
+    background: set[asyncio.Task] = set()
+
+    async def fallback():
+        return simkl.cached_choices("movies", "avatar"), "empty"
+
+    start = time.perf_counter()
+    choices = await within_deadline(simkl.search("movies", "avatar"), 0.2, fallback, background, "add")
+    answered = time.perf_counter() - start
+    await asyncio.gather(*background)
+    cached = await simkl.search_cache.get(simkl.search_key("movie", "avatar"))
+    faults.latency = 0.005
+
+    print(f"deadline  answered in {answered * 1000:.0f} ms with {len(choices)} choices, "
+          f"late result {'cached' if cached else 'missing'}")
+    return answered < 0.3 and choices == [] and bool(cached)
+
+
+async def main(count: int, port: int) -> int:
+    faults = Faults(latency=0.005)
+    runner = await start_fake_simkl(port, faults)
+    simkl.client = simkl.SimklClient(base_url=f"http://127.0.0.1:{port}", rate=200, burst=20, max_retries=4,
+                                     retry_base=0.01, retry_cap=0.2, breaker_threshold=5, breaker_reset=0.5)
+    simkl.detail_cache = DetailCache()
+    simkl.search_cache = SearchCache()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+        await db.initialize()
+        try:
+            results = [
+                await flaky(simkl.client, faults, count),
+                await outage(simkl.client, faults),
+                await recovery(simkl.client, faults),
+                await deadline(faults),
+            ]
+        finally:
+            await simkl.client.close()
+            await runner.cleanup()
+            db.close()
+
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simkl client behaviour against a fake server that injects faults")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.requests, args.port)))
@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import asyncio
+import argparse
+import statistics
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import simkl  # noqa: E402
+from fake_simkl import start_fake_simkl  # noqa: E402
+
+
+###########################################
+# --------------) Timing (----------------#
+###########################################
+
+async def unpooled_request(url: str):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            return await response.json()
+
+
+async def time_requests(request, count: int) -> list[float]:
+    timings = []
+    for _ in range(count):
+        start = time.perf_counter()
+        await request()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list[float]):
+    timings = sorted(timings)
+    p95 = timings[int(len(timings) * 0.95) - 1]
+    print(f"{label:<10} mean {statistics.mean(timings):7.3f} ms   "
+          f"p50 {statistics.median(timings):7.3f} ms   p95 {p95:7.3f} ms")
+
+
+async def main(count: int, port: int):
+    runner = await start_fake_simkl(port)
+    base_url = f"http://127.0.0.1:{port}"
+    endpoint = "/movies/1?extended=full"
+    # Unthrottled so the comparison measures connection reuse, not the rate limiter
+    client = simkl.SimklClient(base_url=base_url, rate=1e9, burst=count)
+
+    try:
+        unpooled = await time_requests(lambda: unpooled_request(base_url + endpoint), count)
+        await client.start()
+        pooled = await time_requests(lambda: client.get(endpoint), count)
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+    print(f"{count} sequential GETs against {base_url}")
+    report("unpooled", unpooled)
+    report("pooled", pooled)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Per-request Simkl latency with and without the pooled client")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.port))
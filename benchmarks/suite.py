@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bot"))
+
+import schema  # noqa: E402
+import database  # noqa: E402
+import embed_state  # noqa: E402
+from title_index import TitleIndex, TO_WATCH, owner  # noqa: E402
+from validation import Movie, Show  # noqa: E402
+from embeds import ToWatchEmbed, WatchedEmbed, MoviePreviewEmbed, TVPreviewEmbed  # noqa: E402
+
+PAYLOADS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "payloads")
+SIZES = [1_000, 10_000, 100_000]
+GUILD_ID = 1
+USERS = 20
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Horror", "Romance", "Science Fiction", "Thriller"]
+WORDS = ["the", "dark", "knight", "return", "of", "avatar", "water", "star", "wars", "empire", "night", "city",
+         "lost", "world", "planet", "storm", "garden", "ghost", "house", "dragon", "river", "shadow", "king"]
+
+
+###########################################
+# -------------) Datasets (---------------#
+###########################################
+
+def populate(rows: int) -> None:
+    # A third of the rows are watched and a tenth unreleased, roughly what a long-running server accumulates
+    rng = random.Random(rows)
+    now = int(time.time())
+    schema.migrate()
+
+    media = []
+    for i in range(1, rows + 1):
+        title = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title() + f" {i}"
+        released = int(rng.random() >= 0.1)
+        release_time = now - rng.randint(0, 10 ** 8) if released else now + rng.randint(1, 10 ** 7)
+        watched_at = now - rng.randint(0, 10 ** 7) if rng.random() < 0.33 else 0
+        media.append((GUILD_ID, i, f"tt{i:07d}", title, released, release_time, rng.randint(80, 200),
+                      round(rng.uniform(1, 10), 1), now - (rows - i), "user", i % USERS, watched_at))
+
+    for table_name in database.MEDIA_TABLES:
+        database.commit_many(
+            '''
+                INSERT INTO {} (guildID, simklID, imdbID, title, isReleased, releaseTime, runtime, rating, addedAt,
+                                userName, userID, watchedAt)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            '''.format(table_name),
+            media
+        )
+        database.commit_many(
+            "INSERT OR IGNORE INTO genres (tableName, genre, simklID) VALUES (?, ?, ?);",
+            [(table_name, GENRES[i % len(GENRES)], i) for i in range(1, rows + 1)]
+        )
+
+    # Every title gets the recorded payload's metadata under its own id
+    for model, name in ((Movie, "movie"), (Show, "show")):
+        table_name, _, *values = database.detail_values(model.model_validate(load_payload(name)))
+        database.commit_many(
+            '''
+                INSERT INTO details (tableName, simklID, year, poster, overview, genres, certification, released,
+                                     director, budget, revenue, totalEpisodes, status, network, updatedAt)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            ''',
+            [(table_name, i, *values) for i in range(1, rows + 1)]
+        )
+
+
+def load_payload(name: str) -> dict:
+    with open(os.path.join(PAYLOADS, f"{name}.json")) as file:
+        return json.load(file)
+
+
+def load_raw_payload(name: str) -> bytes:
+    with open(os.path.join(PAYLOADS, f"{name}.json"), "rb") as file:
+        return file.read()
+
+
+def detail_path(model: type[Movie] | type[Show], raw: bytes, embed) -> None:
+    # What /add does with a cached payload: parse once, derive the row values, then render the preview
+    media = model.model_validate_json(raw)
+    database.update_values(media)
+    embed(media, 0xfaff00).build_embed()
+
+
+###########################################
+# -------------) Benchmarks (-------------#
+###########################################
+
+def database_benchmarks() -> dict:
+    index = TitleIndex()
+    index.load([row for _, *row in database.get_index_rows("movies")])
+
+    return {
+        "get_to_watch_data": lambda: database.get_to_watch_data("movies", GUILD_ID),
+        "get_watched_data": lambda: database.get_watched_data("movies", GUILD_ID),
+        "search_to_watch_titles.indexed": lambda: database.search_to_watch_titles("movies", GUILD_ID, "dark kni"),
+        "search_to_watch_titles.short": lambda: database.search_to_watch_titles("movies", GUILD_ID, "av"),
+        "get_owned_entries": lambda: database.get_owned_entries("movies", GUILD_ID, "storm", 3),
+        "title_index.search": lambda: index.search("dark kni", TO_WATCH),
+        "title_index.search_owner": lambda: index.search("storm", owner(3)),
+        "title_index.search_substring": lambda: index.search("ing 42", TO_WATCH),
+        "select_random_simkl_id": lambda: database.select_random_simkl_id("movies", GUILD_ID),
+        "select_random_simkl_id.filtered": lambda: database.select_random_simkl_id("movies", GUILD_ID, 150, 5.0, 3,
+                                                                                   "Drama"),
+        "get_details": lambda: database.get_details("movies", GUILD_ID, 42),
+        "preview.local": lambda: MoviePreviewEmbed(database.get_details("movies", GUILD_ID, 42),
+                                                   0xfaff00).build_embed(),
+        "list_view.load": lambda: embed_state.views_for(GUILD_ID)["to_watch"].load(
+            "movies", [row for _, *row in database.get_view_rows("movies")]),
+    }
+
+
+def static_benchmarks() -> dict:
+    movie_payload, show_payload = load_payload("movie"), load_payload("show")
+    movie_raw, show_raw = load_raw_payload("movie"), load_raw_payload("show")
+    movie, show = Movie.model_validate(movie_payload), Show.model_validate(show_payload)
+    to_watch_rows = [database.format_to_watch_row("movies", i, f"Avatar {i}", 162, 7.9, 1, 0) for i in range(15)]
+    to_watch_columns = tuple(list(column) for column in zip(*to_watch_rows))
+    watched_rows = [database.format_watched_row(f"Avatar {i}", 1700000000) for i in range(35)]
+    watched_columns = (*(list(column) for column in zip(*watched_rows)), 'ㅤ')
+
+    return {
+        "Movie.model_validate": lambda: Movie.model_validate(movie_payload),
+        "Show.model_validate": lambda: Show.model_validate(show_payload),
+        "Movie.model_validate_json": lambda: Movie.model_validate_json(movie_raw),
+        "Show.model_validate_json": lambda: Show.model_validate_json(show_raw),
+        "detail_path.movie": lambda: detail_path(Movie, movie_raw, MoviePreviewEmbed),
+        "detail_path.show": lambda: detail_path(Show, show_raw, TVPreviewEmbed),
+        "ToWatchEmbed.build_embed": lambda: ToWatchEmbed(to_watch_columns, to_watch_columns).build_embed(),
+        "WatchedEmbed.build_embed": lambda: WatchedEmbed(watched_columns, watched_columns).build_embed(),
+        "MoviePreviewEmbed.build_embed": lambda: MoviePreviewEmbed(movie, 0xfaff00).build_embed(),
+        "TVPreviewEmbed.build_embed": lambda: TVPreviewEmbed(show, 0xfaff00).build_embed(),
+    }
+
+
+def measure(func, budget: float, min_runs: int = 5, max_runs: int = 10_000) -> dict:
+    func()
+    timings = []
+    deadline = time.perf_counter() + budget
+
+    while len(timings) < min_runs or (len(timings) < max_runs and time.perf_counter() < deadline):
+        start = time.perf_counter_ns()
+        func()
+        timings.append((time.perf_counter_ns() - start) / 1000)
+
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "mean_us": round(statistics.mean(timings), 3),
+        "p50_us": round(statistics.median(timings), 3),
+        "p95_us": round(timings[max(0, int(len(timings) * 0.95) - 1)], 3),
+        "min_us": round(timings[0], 3),
+    }
+
+
+def run(sizes: list[int], budget: float, selected: str | None) -> dict:
+    results = {}
+
+    def record(name: str, func) -> None:
+        if selected and selected not in name:
+            return
+        results[name] = measure(func, budget)
+        print(f"{name:<48} p50 {results[name]['p50_us']:>12.1f} us   p95 {results[name]['p95_us']:>12.1f} us")
+
+    for name, func in static_benchmarks().items():
+        record(name, func)
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as directory:
+            database.manager = database.ConnectionManager(os.path.join(directory, "list.db"))
+            populate(size)
+            for name, func in database_benchmarks().items():
+                record(f"{name}@{size}", func)
+            database.close()
+
+    return {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "sizes": sizes,
+        },
+        "results": results,
+    }
+
+
+###########################################
+# --------------) Compare (---------------#
+###########################################
+
+def compare(baseline: dict, current: dict, threshold: float, metric: str) -> int:
+    regressions = 0
+
+    for name, result in current["results"].items():
+        if name not in baseline["results"]:
+            print(f"{'new':<6} {name}")
+            continue
+
+        before, after = baseline["results"][name][metric], result[metric]
+        change = after / before - 1 if before else 0.0
+        status = "SLOWER" if change > threshold else "faster" if change < -threshold else "ok"
+        regressions += status == "SLOWER"
+        print(f"{status:<6} {name:<48} {before:>12.1f} -> {after:>12.1f} us ({change:+.1%})")
+
+    print(f"{regressions} regression(s) beyond {threshold:.0%} on {metric}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the database, validation and embeds")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the suite and save the results as JSON")
+    run_parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    run_parser.add_argument("--budget", type=float, default=0.5, help="Seconds spent per benchmark")
+    run_parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    run_parser.add_argument("--output", default="benchmark-results.json")
+
+    compare_parser = commands.add_parser("compare", help="Flag benchmarks that got slower than a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.15)
+    compare_parser.add_argument("--metric", default="p50_us", choices=["mean_us", "p50_us", "p95_us", "min_us"])
+
+    args = parser.parse_args()
+    if args.command == "run":
+        results = run(args.sizes, args.budget, args.filter)
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved {len(results['results'])} results to {args.output}")
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    return compare(baseline, current, args.threshold, args.metric)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
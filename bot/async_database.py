@@ -0,0 +1,170 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import schema
+import metrics
+import database
+import embed_state
+import title_index
+from validation import Movie, Show
+
+# Reads share the reader pool; every write funnels through one thread so commits never contend
+read_executor = ThreadPoolExecutor(max_workers=database.READER_CONNECTIONS, thread_name_prefix="db-read")
+write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+
+
+###########################################
+# --------------) General (---------------#
+###########################################
+
+def run_in(executor: ThreadPoolExecutor):
+    def decorator(func):
+        # Timed on the worker thread, so this is query time without the executor queue
+        timed_func = metrics.timed("db_query_seconds", function=func.__name__)(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, functools.partial(timed_func, *args, **kwargs))
+
+        return wrapper
+
+    return decorator
+
+
+reader = run_in(read_executor)
+writer = run_in(write_executor)
+
+released = database.released
+update_values = database.update_values
+execute_query = reader(database.execute_query)
+commit_query = writer(database.commit_query)
+commit_many = writer(database.commit_many)
+entry_exists = reader(database.entry_exists)
+initialize = writer(schema.migrate)
+get_index_rows = reader(database.get_index_rows)
+
+
+get_view_rows = reader(database.get_view_rows)
+get_view_row = reader(database.get_view_row)
+register_list_message = writer(database.register_list_message)
+get_list_messages = reader(database.get_list_messages)
+
+
+async def load_title_indexes() -> None:
+    for table_name in database.MEDIA_TABLES:
+        title_index.load(table_name, await get_index_rows(table_name))
+
+
+async def load_list_views() -> None:
+    for table_name in database.MEDIA_TABLES:
+        embed_state.load(table_name, await get_view_rows(table_name))
+
+
+async def refresh_list_views(table_name: str, guild_id: int, simkl_ids: list[int]) -> None:
+    for simkl_id in simkl_ids:
+        embed_state.apply(table_name, guild_id, simkl_id, await get_view_row(table_name, guild_id, simkl_id))
+
+
+def close() -> None:
+    write_executor.shutdown(wait=True)
+    read_executor.shutdown(wait=True)
+    database.close()
+
+
+###########################################
+# ---------------) Cache (----------------#
+###########################################
+
+get_cached_payload = reader(database.get_cached_payload)
+store_payload = writer(database.store_payload)
+prune_payloads = writer(database.prune_payloads)
+get_search = reader(database.get_search)
+store_search = writer(database.store_search)
+record_search_usage = writer(database.record_search_usage)
+get_popular_searches = reader(database.get_popular_searches)
+get_search_bytes = reader(database.get_search_bytes)
+prune_searches = writer(database.prune_searches)
+
+
+###########################################
+# --------------) Details (---------------#
+###########################################
+
+store_details = writer(database.store_details)
+get_details = reader(database.get_details)
+get_missing_details = reader(database.get_missing_details)
+
+
+###########################################
+# --------------) Update (----------------#
+###########################################
+
+get_unreleased_ids = reader(database.get_unreleased_ids)
+get_unreleased_entries = reader(database.get_unreleased_entries)
+get_due_refreshes = reader(database.get_due_refreshes)
+get_refresh_queue = reader(database.get_refresh_queue)
+reschedule = writer(database.reschedule)
+update_entry = writer(database.update_entry)
+_update_entries = writer(database.update_entries)
+
+
+async def update_entries(table_name: str, guild_id: int, entries: list[tuple[int, Movie | Show]]) -> None:
+    await _update_entries(table_name, guild_id, entries)
+    await refresh_list_views(table_name, guild_id, [simkl_id for simkl_id, _ in entries])
+
+
+###########################################
+# --------------) Remove (----------------#
+###########################################
+
+get_owned_entries = reader(database.get_owned_entries)
+_remove_entry = writer(database.remove_entry)
+
+
+async def remove_entry(table_name: str, guild_id: int, simkl_id: int, user_id: int) -> None:
+    await _remove_entry(table_name, guild_id, simkl_id, user_id)
+    title_index.index_for(guild_id, table_name).remove(simkl_id, user_id)
+    await refresh_list_views(table_name, guild_id, [simkl_id])
+
+
+###########################################
+# -------------) To Watch (---------------#
+###########################################
+
+_insert = writer(database.insert)
+
+
+async def insert(media: Movie | Show, guild_id: int, user_name: str, user_id: int) -> None:
+    await _insert(media, guild_id, user_name, user_id)
+    title_index.index_for(guild_id, media.table_name).add(media.ids.simkl, media.title, user_id)
+    await refresh_list_views(media.table_name, guild_id, [media.ids.simkl])
+
+
+get_genres = reader(database.get_genres)
+get_to_watch_data = reader(database.get_to_watch_data)
+search_to_watch_titles = reader(database.search_to_watch_titles)
+search_known_titles = reader(database.search_known_titles)
+select_random_simkl_id = reader(database.select_random_simkl_id)
+get_to_watch_owner_data = reader(database.get_to_watch_owner_data)
+
+
+###########################################
+# --------------) Watched (---------------#
+###########################################
+
+_set_watched = writer(database.set_watched)
+
+
+async def set_watched(table_name: str, guild_id: int, simkl_id: int) -> None:
+    await _set_watched(table_name, guild_id, simkl_id)
+    title_index.index_for(guild_id, table_name).set_watched(simkl_id)
+    await refresh_list_views(table_name, guild_id, [simkl_id])
+
+
+get_watched_data = reader(database.get_watched_data)
+
+
+if __name__ == '__main__':
+    pass
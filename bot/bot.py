@@ -3,22 +3,48 @@ import re
 import simkl
 import asyncio
 import sqlite3
+import embed_state
+import title_index
 import interactions
-import database as db
+import metrics
+import async_database as db
+import database
 from log import get_logger
+from list_updater import ListUpdater
+from scheduling import FairScheduler
+from refresh import RefreshScheduler, backfill_details
+from resilience import within_deadline
 from dotenv import load_dotenv
-from validation import Movie, Show, get_current_timestamp
-from embeds import WatchedEmbed, ToWatchEmbed, MoviePreviewEmbed, TVPreviewEmbed
-from interactions import slash_command, Intents, SlashContext, AutocompleteContext, Client, listen, slash_option, \
-    OptionType, SlashCommandChoice
+from validation import Movie, Show, get_current_timestamp, printable_title
+from embeds import MoviePreviewEmbed, TVPreviewEmbed
+from interactions import slash_command, Intents, SlashContext, AutocompleteContext, AutoShardedClient, listen, \
+    slash_option, OptionType, SlashCommandChoice, ComponentContext, component_callback
 
 load_dotenv()
 
 WATCHED_MESSAGE_ID = 1245925656592908299
 MAIN_MESSAGE_ID = 1245925657628905472
+LEGACY_GUILD_ID = int(os.getenv("LEGACY_GUILD_ID", 0))
+LEGACY_CHANNEL_ID = int(os.getenv("LEGACY_CHANNEL_ID", 0))
 BOT_ID = os.getenv("DISCORD_BOT_ID")
+REFRESH_CONCURRENCY = int(os.getenv("REFRESH_CONCURRENCY", 8))
+AUTOCOMPLETE_DEADLINE = float(os.getenv("AUTOCOMPLETE_DEADLINE", 2.0))
+AUTOCOMPLETE_SEND_MARGIN = 0.5  # left for the response itself to reach Discord
 logger = get_logger("DiscordBot")
-bot = Client(
+list_updater = ListUpdater()
+refresh_scheduler = FairScheduler(REFRESH_CONCURRENCY)
+background_tasks: set[asyncio.Task] = set()
+scheduled_refresh = RefreshScheduler(refresh_scheduler, lambda guild_id: list_updater.mark_dirty(guild_id, "to_watch"))
+metrics_server = metrics.MetricsServer()
+
+
+class MovieNightsClient(AutoShardedClient):
+    async def _run_slash_command(self, command, ctx):
+        with metrics.timer("command_seconds", command=str(command.name)):
+            return await super()._run_slash_command(command, ctx)
+
+
+bot = MovieNightsClient(
     intents=Intents.DEFAULT,
     send_command_tracebacks=False,
     sync_interactions=True,
@@ -31,11 +57,53 @@ bot = Client(
 # -------------) General (----------------#
 ###########################################
 
+@listen()
+async def on_startup():
+    await db.initialize()
+    await db.load_title_indexes()
+    await db.load_list_views()
+    await load_list_messages()
+    await simkl.client.start()
+    await simkl.detail_cache.prune()
+    await simkl.search_cache.flush()
+    await simkl.search_cache.warm()
+    list_updater.start(bot.http)
+    scheduled_refresh.start()
+    await metrics_server.start()
+
+    # Runs behind on_ready; commands for titles it has not reached yet simply fetch them as before
+    task = asyncio.create_task(backfill_details(refresh_scheduler))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+
+async def load_list_messages() -> None:
+    registrations = await db.get_list_messages()
+    if LEGACY_GUILD_ID and LEGACY_CHANNEL_ID and not any(row[0] == LEGACY_GUILD_ID for row in registrations):
+        # The original single-server deployment predates registration, so adopt its messages once
+        for name, message_id in (("watched", WATCHED_MESSAGE_ID), ("to_watch", MAIN_MESSAGE_ID)):
+            await db.register_list_message(LEGACY_GUILD_ID, name, LEGACY_CHANNEL_ID, message_id)
+        registrations = await db.get_list_messages()
+
+    for guild_id, name, channel_id, message_id in registrations:
+        list_updater.register(guild_id, name, channel_id, message_id)
+
+
 @listen()
 async def on_ready():
     logger.info(f"MovieNights bot is ready.")
     
     
+def autocomplete_budget(ctx: AutocompleteContext) -> float:
+    # Discord stops waiting three seconds after the interaction was created, not after we received it
+    remaining = (ctx.expires_at - interactions.Timestamp.utcnow()).total_seconds()
+    return max(0.0, min(AUTOCOMPLETE_DEADLINE, remaining - AUTOCOMPLETE_SEND_MARGIN))
+
+
+async def no_choices() -> tuple[list[dict], str]:
+    return [], "empty"
+
+
 def media_type_option():
     def wrapper(func):
         return slash_option(
@@ -65,50 +133,87 @@ def title_option():
     return wrapper
 
 
-async def update_to_watch_message(channel):
-    to_watch_message = await channel.fetch_message(message_id=MAIN_MESSAGE_ID)
-    await to_watch_message.edit(embed=create_to_watch_embed())
+async def update_unreleased_media(media_type: str, guild_id: int, progress=None) -> dict[str, int]:
+    unreleased = {simkl_id: tuple(values)
+                  for simkl_id, *values in await db.get_unreleased_entries(media_type, guild_id)}
+    summary = {"refreshed": 0, "changed": 0, "failed": 0}
+    updates: list[tuple[int, Movie | Show]] = []
+    fetched: list[Movie | Show] = []
 
+    async def refresh(simkl_id: int):
+        # Fetches from every guild share the worker pool round-robin, so a large list cannot starve a small one.
+        # Fresh, like the scheduled refresh: only this guild's titles are refetched, the shared cache stays warm
+        media: Movie | Show | None = await refresh_scheduler.submit(
+            guild_id, lambda: simkl.id_to_object(media_type, simkl_id, fresh=True))
 
-async def update_watched_message(channel):
-    watched_message = await channel.fetch_message(message_id=WATCHED_MESSAGE_ID)
-    await watched_message.edit(embed=create_watched_embed())
+        if media is None:
+            summary["failed"] += 1
+        else:
+            summary["refreshed"] += 1
+            fetched.append(media)
+            if db.update_values(media) != unreleased[simkl_id]:
+                summary["changed"] += 1
+                updates.append((simkl_id, media))
 
+        if progress:
+            await progress(media_type, summary["refreshed"] + summary["failed"], len(unreleased))
 
-async def update_unreleased_media(media_type: str):
-    unreleased_ids = db.get_unreleased_ids(media_type)
+    await asyncio.gather(*(refresh(simkl_id) for simkl_id in unreleased))
+    await db.store_details(fetched)
+    await db.update_entries(media_type, guild_id, updates)
 
-    for _id, in unreleased_ids:
-        media: Movie | Show = await simkl.id_to_object(media_type, _id)
-        db.update_entry(media_type, media)
+    logger.info(f"Refreshed unreleased {media_type} in guild {guild_id}: {summary}")
+    return summary
 
 
 ###########################################
-# -----------) Main Embeds (--------------#
+# ------------) List Pages (--------------#
 ###########################################
 
-def create_to_watch_embed() -> interactions.Embed:
-    movie_data = db.get_to_watch_data("movies")
-    tv_data = db.get_to_watch_data("tv")
+@component_callback(re.compile(r"^page:(to_watch|watched):(prev|next)$"))
+async def list_page_callback(ctx: ComponentContext):
+    _, name, direction = ctx.custom_id.split(":")
+    view = embed_state.views_for(ctx.guild_id)[name]
+    view.turn(-1 if direction == "prev" else 1)
+    embed, components, _ = view.render()
 
-    e = ToWatchEmbed(movie_data, tv_data)
-    embed = e.build_embed()
-    return embed
-
-
-def create_watched_embed() -> interactions.Embed:
-    movie_data = db.get_watched_data("movies")
-    tv_data = db.get_watched_data("tv")
-
-    e = WatchedEmbed(movie_data, tv_data)
-    embed = e.build_embed()
-    return embed
+    try:
+        await ctx.edit_origin(embed=embed, components=components)
+    except Exception:
+        view.forget_rendered()
+        raise
 
 
 ###########################################
 # -----------) Preview Embed (------------#
 ###########################################
 
+async def load_media(media_type: str, guild_id: int, simkl_id: int) -> Movie | Show | None:
+    # Listed titles render from local metadata; only rows the backfill has not reached yet go to Simkl
+    media = await db.get_details(media_type, guild_id, simkl_id)
+    if media is not None:
+        metrics.increment("preview_lookups", source="local")
+        return media
+
+    metrics.increment("preview_lookups", source="simkl")
+    media = await simkl.id_to_object(media_type, simkl_id)
+    if media is not None:
+        await db.store_details([media])
+    return media
+
+
+def unavailable_message(media_type: str) -> str:
+    # Simkl being down and a title missing from Simkl both leave nothing to preview, but ask for different things
+    if not simkl.client.available:
+        return "# 🛇 Simkl is not responding, try again in a minute."
+
+    pretty_map = {
+        "movies": "Movie",
+        "tv": "Show"
+    }
+    return f"# 🛇 {pretty_map[media_type]} cannot be found."
+
+
 def create_preview_embed(media: Movie | Show, color) -> interactions.Embed:
     if isinstance(media, Show):
         e = TVPreviewEmbed(media, color)
@@ -125,50 +230,63 @@ def create_preview_embed(media: Movie | Show, color) -> interactions.Embed:
 
 @slash_command(
     name="add",
-    description="Add to the list"
+    description="Add to the list",
+    dm_permission=False
 )
 @media_type_option()
 @title_option()
 async def add_function(ctx: SlashContext, media_type: str, title: int):
     await ctx.defer()
 
-    if db.entry_exists(media_type, title):
+    if await db.entry_exists(media_type, ctx.guild_id, title):
         await ctx.send(f"# 🗍 Already on the list.", delete_after=10)
         return
 
     media = await simkl.id_to_object(media_type, title)
     if not media:
-        pretty_map = {
-            "movies": "Movie",
-            "tv": "Show"
-        }
-
-        await ctx.send(f"# 🛇 {pretty_map[media_type]} cannot be found.", delete_after=10)
+        await ctx.send(unavailable_message(media_type), delete_after=10)
         return
 
     user_name: str = str(ctx.author.username)
     user_id: int = int(ctx.author_id)
 
     try:
-        db.insert(media, user_name, user_id)
+        await db.insert(media, ctx.guild_id, user_name, user_id)
     except sqlite3.DatabaseError as e:
         logger.error(f"{type(e)=}\n{e=}")
         return
 
-    await asyncio.gather(
-        update_to_watch_message(ctx.channel),
-        ctx.send(embed=create_preview_embed(media, 0x87ff00))
-    )
+    list_updater.mark_dirty(ctx.guild_id, "to_watch")
+    await ctx.send(embed=create_preview_embed(media, 0x87ff00))
+
+
+async def add_fallback(media_type: str, guild_id: int, search_string: str) -> tuple[list[dict], str]:
+    choices = simkl.cached_choices(media_type, search_string)
+    if choices:
+        return choices, "cache"
+
+    table_name = media_type if media_type in database.MEDIA_TABLES else "movies"
+    choices = [simkl.search_choice(title, year, simkl_id)
+               for simkl_id, title, year in await db.search_known_titles(table_name, guild_id, search_string)]
+    return choices, "local" if choices else "empty"
 
 
 @add_function.autocomplete("title")
+@metrics.timed("autocomplete_seconds", command="add")
 async def add_autocomplete(ctx: AutocompleteContext):
     search_string = ctx.input_text
     media_type = ctx.kwargs.get("media_type", "movie")
     sanitized_search_string = re.sub('[^A-z0-9?! ]', '', search_string) if len(search_string) >= 2 else "avatar"
 
     if sanitized_search_string and len(sanitized_search_string) < 75:
-        results = await simkl.search(media_type, sanitized_search_string.lower())
+        search_string = sanitized_search_string.lower()
+        results = await within_deadline(simkl.search(media_type, search_string, int(ctx.author_id)),
+                                        autocomplete_budget(ctx),
+                                        lambda: add_fallback(media_type, ctx.guild_id, search_string),
+                                        background_tasks, "add")
+        if results is None:
+            # A newer keystroke from the same user replaced this request
+            return
         await ctx.send(choices=results)
     else:
         await ctx.send(choices=[])
@@ -180,28 +298,26 @@ async def add_autocomplete(ctx: AutocompleteContext):
 
 @slash_command(
     name="watched",
-    description="Remove from the to watch list and add to the watch list"
+    description="Remove from the to watch list and add to the watch list",
+    dm_permission=False
 )
 @media_type_option()
 @title_option()
 async def watched_function(ctx: SlashContext, media_type: str, title: int):
     await ctx.defer(ephemeral=True)
 
-    db.set_watched(media_type, title)
-    channel = ctx.channel
+    await db.set_watched(media_type, ctx.guild_id, title)
+    list_updater.mark_dirty(ctx.guild_id, "to_watch", "watched")
 
-    await asyncio.gather(
-        update_to_watch_message(channel),
-        update_watched_message(channel),
-        ctx.send("# ⮃ Added to watched list.", ephemeral=True)
-    )
+    await ctx.send("# ⮃ Added to watched list.", ephemeral=True)
 
 
 @watched_function.autocomplete("title")
+@metrics.timed("autocomplete_seconds", command="watched")
 async def watched_autocomplete(ctx: AutocompleteContext):
     search_string = ctx.input_text
     media_type = ctx.kwargs.get("media_type", "movies")
-    choices = db.search_to_watch_titles(media_type, search_string)
+    choices = title_index.index_for(ctx.guild_id, media_type).search(search_string, title_index.TO_WATCH)
 
     await ctx.send(choices=choices)
 
@@ -212,16 +328,34 @@ async def watched_autocomplete(ctx: AutocompleteContext):
 
 @slash_command(
     name="random",
-    description="Select randomly from the list"
+    description="Select randomly from the list",
+    dm_permission=False
 )
 @media_type_option()
-async def random_function(ctx: SlashContext, media_type: str):
+@slash_option(name="max_runtime", description="Longest runtime in minutes", required=False,
+              opt_type=OptionType.INTEGER, min_value=1)
+@slash_option(name="min_rating", description="Lowest IMDb rating", required=False,
+              opt_type=OptionType.NUMBER, min_value=0, max_value=10)
+@slash_option(name="added_by", description="Only titles added by this user", required=False,
+              opt_type=OptionType.USER)
+@slash_option(name="genre", description="Genre", required=False, opt_type=OptionType.STRING, autocomplete=True)
+async def random_function(ctx: SlashContext, media_type: str, max_runtime: int = None, min_rating: float = None,
+                          added_by: interactions.User = None, genre: str = None):
     await ctx.defer()
 
-    random_id = db.select_random_simkl_id(media_type)
-    results = db.get_to_watch_owner_data(media_type, random_id)
+    user_id = int(added_by.id) if added_by else None
+    random_id = await db.select_random_simkl_id(media_type, ctx.guild_id, max_runtime, min_rating, user_id, genre)
+    if random_id is None:
+        await ctx.send("# Nothing on the list matches.", delete_after=10)
+        return
+
+    results = await db.get_to_watch_owner_data(media_type, ctx.guild_id, random_id)
     user_id, added_at = results[0]
-    media = await simkl.id_to_object(media_type, random_id)
+    media = await load_media(media_type, ctx.guild_id, random_id)
+    if media is None:
+        await ctx.send(unavailable_message(media_type), delete_after=10)
+        return
+
     embed = create_preview_embed(media, 0xfaff00)
     footer = [
         {
@@ -240,6 +374,16 @@ async def random_function(ctx: SlashContext, media_type: str):
     await ctx.send(embed=embed, delete_after=600)
 
 
+@random_function.autocomplete("genre")
+@metrics.timed("autocomplete_seconds", command="random")
+async def random_genre_autocomplete(ctx: AutocompleteContext):
+    media_type = ctx.kwargs.get("media_type", "movies")
+    choices = await within_deadline(db.get_genres(media_type, ctx.guild_id, ctx.input_text), autocomplete_budget(ctx),
+                                    no_choices, background_tasks, "random")
+
+    await ctx.send(choices=choices)
+
+
 ###########################################
 # ---------------) /remove (--------------#
 ###########################################
@@ -247,29 +391,27 @@ async def random_function(ctx: SlashContext, media_type: str):
 @slash_command(
     name="remove",
     description="Remove a movie from the list that you added",
+    dm_permission=False
 )
 @media_type_option()
 @title_option()
 async def remove_function(ctx: SlashContext, media_type: str, title: int):
     await ctx.defer(ephemeral=True)
-    channel = ctx.channel
     user_id = ctx.author_id
 
-    db.remove_entry(media_type, title, user_id)
+    await db.remove_entry(media_type, ctx.guild_id, title, user_id)
+    list_updater.mark_dirty(ctx.guild_id, "to_watch", "watched")
 
-    await asyncio.gather(
-        update_watched_message(channel),
-        update_to_watch_message(channel),
-        ctx.send("# Removed from list.", ephemeral=True)
-    )
+    await ctx.send("# Removed from list.", ephemeral=True)
 
 
 @remove_function.autocomplete("title")
+@metrics.timed("autocomplete_seconds", command="remove")
 async def remove_autocomplete(ctx: AutocompleteContext):
     media_type = ctx.kwargs.get("media_type", "movies")
     search_string = ctx.input_text
     user_id = ctx.author_id
-    choices = db.get_owned_entries(media_type, search_string, user_id)
+    choices = title_index.index_for(ctx.guild_id, media_type).search(search_string, title_index.owner(user_id))
 
     await ctx.send(choices=choices)
 
@@ -281,16 +423,21 @@ async def remove_autocomplete(ctx: AutocompleteContext):
 @slash_command(
     name="info",
     description="Get more info on an entry in the \"To Watch\" list",
+    dm_permission=False
 )
 @media_type_option()
 @title_option()
 async def info_function(ctx: SlashContext, media_type: str, title: int):
     await ctx.defer(ephemeral=True)
 
-    results = db.get_to_watch_owner_data(media_type, title)
+    results = await db.get_to_watch_owner_data(media_type, ctx.guild_id, title)
     if results:
         user_id, added_at = results[0]
-        media = await simkl.id_to_object(media_type, title)
+        media = await load_media(media_type, ctx.guild_id, title)
+        if media is None:
+            await ctx.send(unavailable_message(media_type), ephemeral=True)
+            return
+
         embed = create_preview_embed(media, 0xfaff00)
         embed.fields = (embed.fields +
                         [{"name": "ㅤ", "value": f"*Added by <@{user_id}> <t:{added_at}:R>*", "inline": False}])
@@ -301,10 +448,11 @@ async def info_function(ctx: SlashContext, media_type: str, title: int):
 
 
 @info_function.autocomplete("title")
+@metrics.timed("autocomplete_seconds", command="info")
 async def info_autocomplete(ctx: AutocompleteContext):
     search_string = ctx.input_text
     media_type = ctx.kwargs.get("media_type", "movies")
-    choices = db.search_to_watch_titles(media_type, search_string)
+    choices = title_index.index_for(ctx.guild_id, media_type).search(search_string, title_index.TO_WATCH)
 
     await ctx.send(choices=choices)
 
@@ -316,14 +464,63 @@ async def info_autocomplete(ctx: AutocompleteContext):
 @slash_command(
     name="send_initial_messages",
     description="Sends initial messages",
-    default_member_permissions=interactions.Permissions.ADMINISTRATOR
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR,
+    dm_permission=False
 )
 async def send_initial_messages_function(ctx: SlashContext):
-    await ctx.channel.send("ㅤ")
-    await ctx.channel.send("ㅤ")
+    for name in ("watched", "to_watch"):
+        message = await ctx.channel.send("ㅤ")
+        await db.register_list_message(ctx.guild_id, name, ctx.channel_id, message.id)
+        list_updater.register(ctx.guild_id, name, ctx.channel_id, message.id)
+
+    list_updater.mark_dirty(ctx.guild_id, "to_watch", "watched")
     await ctx.send("# Sent initial messages.", ephemeral=True)
 
 
+###########################################
+# -----------) /rebuild_index (-----------#
+###########################################
+
+@slash_command(
+    name="rebuild_index",
+    description="Verify and rebuild the in-memory title index",
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR,
+    dm_permission=False
+)
+async def rebuild_index_function(ctx: SlashContext):
+    await ctx.defer(ephemeral=True)
+    lines = []
+
+    for media_type in database.MEDIA_TABLES:
+        index = title_index.index_for(ctx.guild_id, media_type)
+        rows = [row for guild_id, *row in await db.get_index_rows(media_type) if guild_id == ctx.guild_id]
+        problems = index.verify(rows)
+        index.load(rows)
+        mismatches = ", ".join(f"{name} {len(ids)}" for name, ids in problems.items())
+        lines.append(f"{media_type}: {len(index.entries)} titles, {index.footprint() / 1024:.1f} KiB "
+                     f"(before rebuild: {mismatches})")
+
+    await ctx.send("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
+###########################################
+# ------------) /cache_stats (------------#
+###########################################
+
+@slash_command(
+    name="cache_stats",
+    description="Show Simkl client, cache and search counters",
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR
+)
+async def cache_stats_function(ctx: SlashContext):
+    stats = {**simkl.detail_cache.stats(), **{f"search_{name}": value for name, value in simkl.search_counters.items()},
+             **{f"search_cache_{name}": value for name, value in simkl.search_cache.stats().items()},
+             **{f"simkl_{name}": value for name, value in simkl.client.stats().items()}}
+    lines = [f"{name}: {value:.2%}" if isinstance(value, float) else f"{name}: {value}"
+             for name, value in stats.items()]
+    await ctx.send("```\n" + "\n".join(lines) + "\n```", ephemeral=True)
+
+
 ###########################################
 # ---------) /update_to_watch (-----------#
 ###########################################
@@ -331,21 +528,124 @@ async def send_initial_messages_function(ctx: SlashContext):
 @slash_command(
     name="update_to_watch",
     description="Update \"To Watch\" list",
-    default_member_permissions=interactions.Permissions.ADMINISTRATOR
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR,
+    dm_permission=False
 )
 async def update_embeds_function(ctx: SlashContext):
     await ctx.defer(ephemeral=True)
-    channel = ctx.channel
+    last_report = 0.0
+
+    async def progress(media_type: str, done: int, total: int):
+        nonlocal last_report
+        now = asyncio.get_running_loop().time()
+        if done == total or now - last_report >= 2:
+            last_report = now
+            await ctx.edit(content=f"↻ Refreshing {media_type}: {done}/{total}")
+
+    summaries = [
+        await update_unreleased_media("movies", ctx.guild_id, progress),
+        await update_unreleased_media("tv", ctx.guild_id, progress)
+    ]
+    totals = {key: sum(summary[key] for summary in summaries) for key in summaries[0]}
+
+    list_updater.mark_dirty(ctx.guild_id, "to_watch", "watched")
+    await ctx.send(f"# ↻ Updated \"To Watch\".\n"
+                   f"Refreshed {totals['refreshed']}, changed {totals['changed']}, failed {totals['failed']}.",
+                   ephemeral=True)
+
+
+###########################################
+# ---------------) /stats (---------------#
+###########################################
+
+def latency_lines(name: str, label: str, limit: int = 10) -> list[str]:
+    lines = []
+    for key, count, p50, p95, p99 in metrics.summarize(name)[:limit]:
+        lines.append(f"{dict(key).get(label, '-'):<24} {count:>7} {p50 * 1000:>9.1f} {p95 * 1000:>9.1f} "
+                     f"{p99 * 1000:>9.1f}")
+    return lines or ["(no samples yet)"]
+
+
+@slash_command(
+    name="stats",
+    description="Show latency, Simkl, cache and database metrics",
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR
+)
+async def stats_function(ctx: SlashContext):
+    _, counters, gauges = metrics.snapshot()
+    header = f"{'':<24} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    lines = ["Commands", header, *latency_lines("command_seconds", "command"),
+             "", "Autocomplete", header, *latency_lines("autocomplete_seconds", "command"),
+             "", "Simkl requests", header, *latency_lines("simkl_request_seconds", "endpoint"),
+             "", "SQLite (busiest)", header, *latency_lines("db_query_seconds", "function", limit=8), ""]
+
+    requests: dict[str, list[float]] = {}
+    for key, value in counters.get("simkl_requests", {}).items():
+        labels = dict(key)
+        totals = requests.setdefault(labels["endpoint"], [0, 0])
+        totals[0] += value
+        totals[1] += value if labels["status"] in ("5xx", "error") else 0
+    for endpoint, (total, errors) in requests.items():
+        lines.append(f"Simkl {endpoint} error rate: {errors / total:.1%} of {int(total)}")
+
+    search_cache = {dict(key)["result"]: value for key, value in counters.get("search_cache", {}).items()}
+    lookups = sum(search_cache.values())
+    search_tiers = gauges.get("search_cache", {})
+    lines.append(f"Search cache hit ratio: {search_cache.get('hit', 0) / lookups if lookups else 0:.1%} "
+                 f"of {int(lookups)} (memory {search_tiers.get('memory_hit_rate', 0):.1%}, "
+                 f"disk {search_tiers.get('disk_hit_rate', 0):.1%} of memory misses)")
+    lines.append(f"Detail cache hit ratio: {gauges.get('detail_cache', {}).get('hit_ratio', 0):.1%}")
+
+    deadlines: dict[str, list[float]] = {}
+    for name, column in (("deadline_misses", 0), ("deadline_fallbacks", 1)):
+        for key, value in counters.get(name, {}).items():
+            deadlines.setdefault(dict(key)["handler"], [0, 0])[column] += value
+    for handler, (misses, fallbacks) in sorted(deadlines.items()):
+        lines.append(f"Autocomplete /{handler}: {int(misses)} deadline misses, {int(fallbacks)} fallbacks served")
+    lines.append(f"Simkl breaker: {simkl.client.breaker.state}")
+
+    await ctx.send("```\n" + "\n".join(lines)[:1990] + "\n```", ephemeral=True)
+
+
+###########################################
+# ----------) /refresh_queue (------------#
+###########################################
+
+@slash_command(
+    name="refresh_queue",
+    description="Show the next scheduled Simkl refreshes",
+    default_member_permissions=interactions.Permissions.ADMINISTRATOR,
+    dm_permission=False
+)
+async def refresh_queue_function(ctx: SlashContext):
+    await ctx.defer(ephemeral=True)
+    next_run = scheduled_refresh.next_run
+    lines = [f"Next run: <t:{int(next_run)}:R>" if next_run else "Next run: not scheduled",
+             f"Last run: {scheduled_refresh.last_summary or 'none yet'}"]
+
+    for media_type in database.MEDIA_TABLES:
+        lines.append(f"\n**{media_type}**")
+        for _, title, is_released, next_refresh in await db.get_refresh_queue(media_type, ctx.guild_id, 10):
+            reason = "rating" if is_released else "release"
+            lines.append(f"<t:{next_refresh}:R> {printable_title(title)} ({reason})")
 
-    await update_unreleased_media("movies")
-    await update_unreleased_media("tv")
+    await ctx.send("\n".join(lines), ephemeral=True)
 
-    await asyncio.gather(
-        update_watched_message(channel),
-        update_to_watch_message(channel),
-        ctx.send("# ↻ Updated \"To Watch\".", ephemeral=True)
-    )
+
+async def main():
+    try:
+        await bot.astart(BOT_ID)
+    finally:
+        for task in background_tasks:
+            task.cancel()
+        await scheduled_refresh.stop()
+        await metrics_server.stop()
+        await list_updater.stop()
+        await refresh_scheduler.stop()
+        await simkl.search_cache.flush()
+        await simkl.client.close()
+        db.close()
 
 
 if __name__ == '__main__':
-    bot.start(BOT_ID)
+    asyncio.run(main())
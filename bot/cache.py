@@ -0,0 +1,287 @@
+import os
+import json
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+import async_database as db
+from log import get_logger
+from cachetools import LRUCache
+from validation import get_current_timestamp
+
+logger = get_logger("Cache")
+
+
+###########################################
+# ------------) Detail Cache (------------#
+###########################################
+
+class DetailCache:
+    def __init__(self, maxsize: int = 512, ttl: int = 86400, stale_ttl: int = 604800):
+        self.memory: LRUCache = LRUCache(maxsize=maxsize)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "stale_hits": 0, "misses": 0, "coalesced": 0,
+                         "refreshes": 0, "fallbacks": 0}
+        # One fetch per key at a time, shared by background refreshes and concurrent misses
+        self.fetching: dict[tuple[str, int], asyncio.Task] = {}
+
+    @classmethod
+    def from_env(cls) -> "DetailCache":
+        return cls(
+            maxsize=int(os.getenv("DETAIL_CACHE_SIZE", 512)),
+            ttl=int(os.getenv("DETAIL_CACHE_TTL", 86400)),
+            stale_ttl=int(os.getenv("DETAIL_CACHE_STALE_TTL", 604800)),
+        )
+
+    def stats(self) -> dict[str, int | float]:
+        # Stale hits are a subset of the tier hits; expired copies only count towards misses and fallbacks
+        hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+        lookups = hits + self.counters["misses"]
+        return {**self.counters, "size": len(self.memory), "hit_ratio": hits / lookups if lookups else 0.0}
+
+    async def _lookup(self, key: tuple[str, int]) -> tuple[bytes | str, int, str] | None:
+        if key in self.memory:
+            return *self.memory[key], "memory_hits"
+
+        row = await db.get_cached_payload(*key)
+        if row is None:
+            return None
+
+        payload, fetched_at = row
+        self.memory[key] = payload, fetched_at
+        return payload, fetched_at, "disk_hits"
+
+    async def _fetch_and_store(self, key: tuple[str, int], fetch: Callable[[], Awaitable[bytes]]) -> bytes | str:
+        payload = await fetch()
+        if payload:
+            fetched_at = get_current_timestamp()
+            self.memory[key] = payload, fetched_at
+            await db.store_payload(*key, payload, fetched_at)
+        return payload
+
+    def _fetch_once(self, key: tuple[str, int], fetch: Callable[[], Awaitable[bytes]]) -> tuple[asyncio.Task, bool]:
+        if key in self.fetching:
+            return self.fetching[key], False
+
+        task = asyncio.create_task(self._fetch_and_store(key, fetch))
+        self.fetching[key] = task
+        task.add_done_callback(lambda _: self.fetching.pop(key, None))
+        return task, True
+
+    async def get(self, media_type: str, simkl_id: int, fetch: Callable[[], Awaitable[bytes]]) -> bytes | str:
+        key = (media_type, simkl_id)
+        cached = await self._lookup(key)
+
+        if cached is not None:
+            payload, fetched_at, tier = cached
+            age = get_current_timestamp() - fetched_at
+
+            if age < self.ttl:
+                self.counters[tier] += 1
+                return payload
+            if age < self.ttl + self.stale_ttl:
+                self.counters[tier] += 1
+                self.counters["stale_hits"] += 1
+                if self._fetch_once(key, fetch)[1]:
+                    self.counters["refreshes"] += 1
+                return payload
+
+        self.counters["misses"] += 1
+        task, started = self._fetch_once(key, fetch)
+        if not started:
+            self.counters["coalesced"] += 1
+        # Shielded so a caller giving up (an autocomplete deadline) does not cancel the fetch for the others
+        payload = await asyncio.shield(task)
+        if not payload and cached is not None:
+            # Simkl is failing, so an expired copy beats no answer at all
+            self.counters["fallbacks"] += 1
+            return cached[0]
+        return payload
+
+    async def refresh(self, media_type: str, simkl_id: int, fetch: Callable[[], Awaitable[bytes]]) -> bytes | str:
+        self.counters["refreshes"] += 1
+        return await self._fetch_and_store((media_type, simkl_id), fetch)
+
+    async def prune(self) -> None:
+        await db.prune_payloads(get_current_timestamp() - self.ttl - self.stale_ttl)
+
+
+###########################################
+# ------------) Search Cache (------------#
+###########################################
+
+class SearchCache:
+    # Segmented LRU: new searches land in probation and move to protected on their second hit, so a burst of
+    # one-off keystrokes only ever evicts other one-off keystrokes
+    PROTECTED_SHARE = 0.8
+    FLUSH_EVERY = 64
+    # Pruning goes below the disk budget so the next few puts do not each trigger another prune
+    PRUNE_TO = 0.9
+
+    def __init__(self, memory_bytes: int = 1 << 20, disk_bytes: int = 16 << 20, memory_ttl: int = 300,
+                 disk_ttl: int = 86400):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.memory_ttl = memory_ttl
+        self.disk_ttl = disk_ttl
+        # search_id -> [results, size, fetched_at, loaded_at, complete]
+        self.probation: OrderedDict[str, list] = OrderedDict()
+        self.protected: OrderedDict[str, list] = OrderedDict()
+        self.probation_size = 0
+        self.protected_size = 0
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        # Hits are written to disk in batches rather than on every keystroke
+        self.usage: dict[str, list[int]] = {}
+        self.flushing: asyncio.Task | None = None
+        # Bytes written since the last prune are added on put, so overwrites count twice until the next flush
+        self.disk_size = 0
+
+    @classmethod
+    def from_env(cls) -> "SearchCache":
+        return cls(
+            memory_bytes=int(os.getenv("SEARCH_CACHE_MEMORY_KIB", 1024)) * 1024,
+            disk_bytes=int(os.getenv("SEARCH_CACHE_DISK_KIB", 16384)) * 1024,
+            memory_ttl=int(os.getenv("SEARCH_CACHE_MEMORY_TTL", 300)),
+            disk_ttl=int(os.getenv("SEARCH_CACHE_DISK_TTL", 86400)),
+        )
+
+    def stats(self) -> dict[str, int | float]:
+        memory_hits, disk_hits = self.counters["memory_hits"], self.counters["disk_hits"]
+        lookups = memory_hits + disk_hits + self.counters["misses"]
+        disk_lookups = lookups - memory_hits
+        return {
+            **self.counters,
+            "entries": len(self.probation) + len(self.protected),
+            "memory_bytes": self.probation_size + self.protected_size,
+            "disk_bytes": self.disk_size,
+            "memory_hit_rate": memory_hits / lookups if lookups else 0.0,
+            "disk_hit_rate": disk_hits / disk_lookups if disk_lookups else 0.0,
+            "hit_ratio": (memory_hits + disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def _remove(self, search_id: str) -> None:
+        if search_id in self.probation:
+            self.probation_size -= self.probation.pop(search_id)[1]
+        elif search_id in self.protected:
+            self.protected_size -= self.protected.pop(search_id)[1]
+
+    def _admit(self, search_id: str, entry: list, protected: bool = False) -> None:
+        self._remove(search_id)
+        if entry[1] > self.memory_bytes:
+            return
+
+        if protected:
+            self.protected[search_id] = entry
+            self.protected_size += entry[1]
+        else:
+            self.probation[search_id] = entry
+            self.probation_size += entry[1]
+        self._rebalance()
+
+    def _rebalance(self) -> None:
+        # Protected overflow is demoted rather than dropped, so it gets one more chance in probation
+        while self.protected_size > self.memory_bytes * self.PROTECTED_SHARE:
+            search_id, entry = self.protected.popitem(last=False)
+            self.protected_size -= entry[1]
+            self.probation[search_id] = entry
+            self.probation_size += entry[1]
+
+        while self.probation_size + self.protected_size > self.memory_bytes:
+            segment = self.probation if self.probation else self.protected
+            _, entry = segment.popitem(last=False)
+            if segment is self.probation:
+                self.probation_size -= entry[1]
+            else:
+                self.protected_size -= entry[1]
+            self.counters["evictions"] += 1
+
+    def _expired(self, entry: list, now: int) -> bool:
+        # A memory copy is re-read from disk after memory_ttl, and never outlives the disk copy
+        return now - entry[3] >= self.memory_ttl or now - entry[2] >= self.disk_ttl
+
+    def _memory_get(self, search_id: str, now: int) -> list | None:
+        entry = self.protected.get(search_id) or self.probation.get(search_id)
+        if entry is None:
+            return None
+
+        if self._expired(entry, now):
+            self._remove(search_id)
+            return None
+
+        if search_id in self.protected:
+            self.protected.move_to_end(search_id)
+        else:
+            self._admit(search_id, entry, protected=True)
+        return entry
+
+    def _record_use(self, search_id: str, now: int) -> None:
+        usage = self.usage.setdefault(search_id, [0, now])
+        usage[0] += 1
+        usage[1] = now
+
+        if len(self.usage) >= self.FLUSH_EVERY:
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self.flushing is None or self.flushing.done():
+            self.flushing = asyncio.create_task(self.flush())
+
+    async def get(self, search_id: str) -> list[dict] | None:
+        now = get_current_timestamp()
+        entry = self._memory_get(search_id, now)
+        if entry is not None:
+            self.counters["memory_hits"] += 1
+            self._record_use(search_id, now)
+            return entry[0]
+
+        row = await db.get_search(search_id)
+        if row is not None and now - row[1] < self.disk_ttl:
+            payload, fetched_at, complete = row
+            results = json.loads(payload)
+            self.counters["disk_hits"] += 1
+            self._admit(search_id, [results, len(payload), fetched_at, now, bool(complete)])
+            self._record_use(search_id, now)
+            return results
+
+        self.counters["misses"] += 1
+        return None
+
+    def peek(self, search_id: str) -> tuple[list[dict], bool] | None:
+        # Memory only and without touching recency or hit counts; used to refine longer queries from a prefix
+        entry = self.protected.get(search_id) or self.probation.get(search_id)
+        if entry is None or self._expired(entry, get_current_timestamp()):
+            return None
+        return entry[0], entry[4]
+
+    async def put(self, search_id: str, results: list[dict], complete: bool) -> None:
+        now = get_current_timestamp()
+        payload = json.dumps(results, separators=(",", ":")).encode()
+        self._admit(search_id, [results, len(payload), now, now, complete])
+        await db.store_search(search_id, payload, now, complete)
+
+        self.disk_size += len(payload)
+        if self.disk_size > self.disk_bytes:
+            self._schedule_flush()
+
+    async def flush(self) -> None:
+        usage, self.usage = self.usage, {}
+        now = get_current_timestamp()
+        await db.record_search_usage([(hits, used_at, search_id) for search_id, (hits, used_at) in usage.items()])
+        await db.prune_searches(now - self.disk_ttl, int(self.disk_bytes * self.PRUNE_TO), now)
+        self.disk_size = await db.get_search_bytes()
+
+    async def warm(self) -> int:
+        # The best scoring searches that fit the protected segment; the rest of memory stays free for new ones
+        now = get_current_timestamp()
+        rows = await db.get_popular_searches(now - self.disk_ttl, int(self.memory_bytes * self.PROTECTED_SHARE), now)
+        for search_id, payload, fetched_at, complete in reversed(rows):
+            self._admit(search_id, [json.loads(payload), len(payload), fetched_at, now, bool(complete)], protected=True)
+
+        logger.info(f"Warmed search cache with {len(rows)} searches "
+                    f"({self.probation_size + self.protected_size} bytes)")
+        return len(rows)
+
+
+if __name__ == '__main__':
+    pass
@@ -1,33 +1,163 @@
 import os
+import json
+import queue
+import random
 import sqlite3
+import threading
+from typing import NamedTuple
 from contextlib import contextmanager
 from validation import Movie, Show, convert_minutes, get_current_timestamp,  printable_title
 
 DATABASE_PATH = f"{os.getcwd()}/list.db"
+READER_CONNECTIONS = int(os.getenv("DATABASE_READERS", 4))
+STATEMENT_CACHE_SIZE = 256
+PAGE_CACHE_KIB = 16 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+MEDIA_TABLES = ("movies", "tv")
+MIN_INDEXED_SEARCH = 3  # the trigram tokenizer cannot match anything shorter
+RANDOM_PROBES = 16  # rowid draws in the first /random batch; later batches draw four times as many
+RANDOM_MAX_PROBES = 256  # largest batch before falling back to COUNT and OFFSET
+RATING_REFRESH_INTERVAL = int(os.getenv("RATING_REFRESH_DAYS", 14)) * 86400
+UNRELEASED_REFRESH_INTERVAL = 7 * 86400
+RELEASE_LEAD = 86400
+RELEASE_GRACE = 6 * 3600
+# Hits decayed by days since last use: frequent searches outlive one-off ones, but not forever
+SEARCH_SCORE = "hits / (1.0 + (? - usedAt) / 86400.0)"
+
+
+###########################################
+# ----------------) Rows (----------------#
+###########################################
+
+# Named rows for results that travel between modules; bulk loaders keep plain tuples since they are
+# destructured immediately and a per-row wrapper would only add cost
+class UnreleasedEntry(NamedTuple):
+    simkl_id: int
+    is_released: int
+    release_time: int
+    runtime: int
+    rating: float
+
+
+class DueRefresh(NamedTuple):
+    guild_id: int
+    simkl_id: int
+    is_released: int
+    release_time: int
+    runtime: int
+    rating: float
+
+
+class QueuedRefresh(NamedTuple):
+    simkl_id: int
+    title: str
+    is_released: int
+    next_refresh: int
+
+
+class OwnerData(NamedTuple):
+    user_id: int
+    added_at: int
+
+
+class ListMessage(NamedTuple):
+    guild_id: int
+    name: str
+    channel_id: int
+    message_id: int
 
 
 ###########################################
 # --------------) General (---------------#
 ###########################################
 
+class ConnectionManager:
+    def __init__(self, path: str, reader_count: int = READER_CONNECTIONS):
+        self.path = path
+        self.reader_count = reader_count
+        self.readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self.reader_total = 0
+        self.writer: sqlite3.Connection | None = None
+        self.writer_lock = threading.Lock()
+        self.pool_lock = threading.Lock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+        conn.execute(f"PRAGMA cache_size = -{PAGE_CACHE_KIB};")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE};")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("PRAGMA busy_timeout = 5000;")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON;")
+        return conn
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self.readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self.pool_lock:
+            if self.reader_total < self.reader_count:
+                self.reader_total += 1
+                return self._connect(read_only=True)
+
+        return self.readers.get()
+
+    @contextmanager
+    def reader(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self.readers.put(conn)
+
+    @contextmanager
+    def writer_connection(self):
+        with self.writer_lock:
+            if self.writer is None:
+                self.writer = self._connect()
+            yield self.writer
+
+    def close(self) -> None:
+        with self.writer_lock:
+            if self.writer is not None:
+                self.writer.execute("PRAGMA optimize;")
+                self.writer.close()
+                self.writer = None
+
+        with self.pool_lock:
+            while self.reader_total:
+                self.readers.get().close()
+                self.reader_total -= 1
+
+
+manager = ConnectionManager(DATABASE_PATH)
+
+
 @contextmanager
 def get_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    try:
+    with manager.writer_connection() as conn:
         yield conn
-    finally:
-        conn.close()
+
+
+def close() -> None:
+    manager.close()
 
 
 def released(release_time: int) -> int:
     return int(release_time <= get_current_timestamp())
 
 
-def execute_query(query: str, params: tuple = ()) -> list | None:
-    with get_connection() as db:
+def execute_query(query: str, params: tuple = (), row_type: type[tuple] | None = None) -> list | None:
+    with manager.reader() as db:
         try:
             cursor = db.cursor()
             cursor.execute(query, params)
+            if row_type is not None:
+                return list(map(row_type._make, cursor.fetchall()))
             return cursor.fetchall()
         finally:
             cursor.close()
@@ -39,61 +169,395 @@ def commit_query(query: str, params: tuple = ()) -> None:
             cursor = db.cursor()
             cursor.execute(query, params)
             db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def commit_many(query: str, params_seq: list[tuple]) -> None:
+    with get_connection() as db:
+        try:
+            cursor = db.cursor()
+            cursor.executemany(query, params_seq)
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+
+def commit_batch(statements: list[tuple[str, list[tuple]]]) -> None:
+    # Several executemany calls in one transaction, for writes that must land together or not at all
+    with get_connection() as db:
+        try:
+            cursor = db.cursor()
+            for query, params_seq in statements:
+                cursor.executemany(query, params_seq)
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
         finally:
             cursor.close()
 
 
-def entry_exists(table_name: str, simkl_id: int) -> int:
+def search_titles(table_name: str, guild_id: int, search_string: str, condition: str, params: tuple) -> list:
+    search_string = search_string.strip().lower()
+
+    if len(search_string) >= MIN_INDEXED_SEARCH:
+        query = '''
+                SELECT media.simklID, media.title
+                FROM {0}Search AS search
+                JOIN {0} AS media ON media.rowid = search.rowid
+                WHERE {0}Search MATCH ?
+                AND media.guildID = ?
+                AND {1}
+                ORDER BY instr(LOWER(media.title), ?) = 1 DESC, search.rank, LENGTH(media.title)
+                LIMIT 25;
+            '''.format(table_name, condition)
+        phrase = '"{}"'.format(search_string.replace('"', '""'))
+        return execute_query(query, (phrase, guild_id, *params, search_string))
+
+    query = '''
+            SELECT simklID, title
+            FROM {0}
+            WHERE guildID = ?
+            AND LOWER(title) LIKE ?
+            AND {1}
+            ORDER BY instr(LOWER(title), ?) = 1 DESC
+            LIMIT 25;
+        '''.format(table_name, condition)
+    return execute_query(query, (guild_id, f'%{search_string}%', *params, search_string))
+
+
+def entry_exists(table_name: str, guild_id: int, simkl_id: int) -> int:
     query = '''
             SELECT EXISTS
-            (SELECT 1 FROM {} WHERE simklID = ?);
+            (SELECT 1 FROM {} WHERE guildID = ? AND simklID = ?);
         '''.format(table_name)
 
-    results = execute_query(query, (simkl_id,))
+    results = execute_query(query, (guild_id, simkl_id))
     exists, = results[0]
     return exists
 
 
+def get_index_rows(table_name: str) -> list | None:
+    query = '''
+            SELECT guildID, simklID, title, userID, watchedAt
+            FROM {};
+        '''.format(table_name)
+
+    rows = execute_query(query)
+    return rows
+
+
+###########################################
+# ---------------) Cache (----------------#
+###########################################
+
+def get_cached_payload(media_type: str, simkl_id: int) -> tuple[bytes | str, int] | None:
+    query = '''
+            SELECT payload, fetchedAt
+            FROM simklCache
+            WHERE mediaType = ?
+            AND simklID = ?;
+        '''
+
+    results = execute_query(query, (media_type, simkl_id))
+    return results[0] if results else None
+
+
+def store_payload(media_type: str, simkl_id: int, payload: bytes | str, fetched_at: int) -> None:
+    query = '''
+            INSERT OR REPLACE INTO simklCache (mediaType, simklID, payload, fetchedAt)
+            VALUES (?, ?, ?, ?);
+        '''
+
+    commit_query(query, (media_type, simkl_id, payload, fetched_at))
+
+
+def prune_payloads(fetched_before: int) -> None:
+    commit_query("DELETE FROM simklCache WHERE fetchedAt < ?;", (fetched_before,))
+
+
+def get_search(search_id: str) -> tuple[bytes, int, int] | None:
+    query = '''
+            SELECT results, fetchedAt, complete
+            FROM searchCache
+            WHERE searchID = ?;
+        '''
+
+    results = execute_query(query, (search_id,))
+    return results[0] if results else None
+
+
+def store_search(search_id: str, results: bytes, fetched_at: int, complete: bool) -> None:
+    query = '''
+            INSERT INTO searchCache (searchID, results, size, hits, fetchedAt, usedAt, complete)
+            VALUES (?, ?, ?, 1, ?, ?, ?)
+            ON CONFLICT (searchID) DO UPDATE
+            SET results = excluded.results, size = excluded.size, fetchedAt = excluded.fetchedAt,
+                usedAt = excluded.usedAt, complete = excluded.complete, hits = hits + 1;
+        '''
+
+    commit_query(query, (search_id, results, len(results), fetched_at, fetched_at, int(complete)))
+
+
+def record_search_usage(usage: list[tuple[int, int, str]]) -> None:
+    query = '''
+            UPDATE searchCache
+            SET hits = hits + ?, usedAt = MAX(usedAt, ?)
+            WHERE searchID = ?;
+        '''
+
+    commit_many(query, usage)
+
+
+def get_popular_searches(fetched_after: int, max_bytes: int, now: int) -> list | None:
+    # Highest scoring first, cut off once the running total of sizes passes the byte budget
+    query = '''
+            SELECT searchID, results, fetchedAt, complete
+            FROM (
+                SELECT searchID, results, fetchedAt, complete,
+                       SUM(size) OVER (ORDER BY {} DESC, usedAt DESC ROWS UNBOUNDED PRECEDING) AS total
+                FROM searchCache
+                WHERE fetchedAt >= ?
+            )
+            WHERE total <= ?
+            ORDER BY total;
+        '''.format(SEARCH_SCORE)
+
+    rows = execute_query(query, (now, fetched_after, max_bytes))
+    return rows
+
+
+def get_search_bytes() -> int:
+    total, = execute_query("SELECT COALESCE(SUM(size), 0) FROM searchCache;")[0]
+    return total
+
+
+def prune_searches(fetched_before: int, max_bytes: int, now: int) -> None:
+    commit_query("DELETE FROM searchCache WHERE fetchedAt < ?;", (fetched_before,))
+    query = '''
+            DELETE FROM searchCache
+            WHERE searchID IN (
+                SELECT searchID
+                FROM (
+                    SELECT searchID, SUM(size) OVER (ORDER BY {} DESC, usedAt DESC ROWS UNBOUNDED PRECEDING) AS total
+                    FROM searchCache
+                )
+                WHERE total > ?
+            );
+        '''.format(SEARCH_SCORE)
+
+    commit_query(query, (now, max_bytes))
+
+
+###########################################
+# --------------) Details (---------------#
+###########################################
+
+def detail_values(media: Movie | Show) -> tuple:
+    # Shows keep first_aired and episode data in the columns movies use for release date and box office
+    if isinstance(media, Show):
+        specific = media.first_aired, None, None, None, media.total_episodes, media.status, media.network
+    else:
+        specific = media.released, media.director, media.budget, media.revenue, None, None, None
+
+    return (media.table_name, media.ids.simkl, media.year, media.poster, media.overview, json.dumps(media.genres),
+            media.certification, *specific, get_current_timestamp())
+
+
+STORE_DETAILS = '''
+        INSERT OR REPLACE INTO details (tableName, simklID, year, poster, overview, genres, certification,
+                                        released, director, budget, revenue, totalEpisodes, status, network,
+                                        updatedAt)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+    '''
+
+
+def store_details(medias: list[Movie | Show]) -> None:
+    commit_many(STORE_DETAILS, [detail_values(media) for media in medias])
+
+
+def get_details(table_name: str, guild_id: int, simkl_id: int) -> Movie | Show | None:
+    # Title, rating and runtime come from the list row, which the refresh scheduler keeps current
+    query = '''
+            SELECT m.imdbID, m.title, m.runtime, m.rating, d.year, d.poster, d.overview, d.genres, d.certification,
+                   d.released, d.director, d.budget, d.revenue, d.totalEpisodes, d.status, d.network
+            FROM {} AS m
+            JOIN details AS d
+            ON d.tableName = ?
+            AND d.simklID = m.simklID
+            WHERE m.guildID = ?
+            AND m.simklID = ?;
+        '''.format(table_name)
+
+    results = execute_query(query, (table_name, guild_id, simkl_id))
+    if not results:
+        return None
+
+    (imdb_id, title, runtime, rating, year, poster, overview, genres, certification,
+     released_at, director, budget, revenue, total_episodes, status, network) = results[0]
+    fields = {
+        "title": title,
+        "year": year,
+        "ids": {"simkl": simkl_id, "imdb": imdb_id},
+        "poster": poster,
+        "runtime": runtime,
+        "ratings": {"imdb": {"rating": rating}},
+        "overview": overview,
+        "genres": json.loads(genres),
+        "certification": certification,
+    }
+
+    if table_name == "tv":
+        return Show.model_validate({**fields, "first_aired": released_at, "total_episodes": total_episodes,
+                                    "status": status, "network": network})
+    return Movie.model_validate({**fields, "released": released_at, "director": director, "budget": budget,
+                                 "revenue": revenue})
+
+
+def get_missing_details(table_name: str, after: int, limit: int) -> list | None:
+    # Ordered by simklID so a backfill can step past titles that failed without selecting them again
+    query = '''
+            SELECT DISTINCT m.simklID
+            FROM {} AS m
+            LEFT JOIN details AS d
+            ON d.tableName = ?
+            AND d.simklID = m.simklID
+            WHERE m.watchedAt = 0
+            AND m.simklID > ?
+            AND d.simklID IS NULL
+            ORDER BY m.simklID
+            LIMIT ?;
+        '''.format(table_name)
+
+    ids = execute_query(query, (table_name, after, limit))
+    return ids
+
+
 ###########################################
 # --------------) Update (----------------#
 ###########################################
 
-def get_unreleased_ids(table_name: str) -> list | None:
+def get_unreleased_ids(table_name: str, guild_id: int) -> list | None:
     query = '''
             SELECT simklID
             FROM {}
-            WHERE isReleased = 0;
+            WHERE guildID = ?
+            AND isReleased = 0;
         '''.format(table_name)
 
-    ids = execute_query(query, ())
+    ids = execute_query(query, (guild_id,))
     return ids
 
 
-def update_entry(table_name: str, media: Movie | Show) -> None:
+def get_unreleased_entries(table_name: str, guild_id: int) -> list | None:
+    query = '''
+            SELECT simklID, isReleased, releaseTime, runtime, rating
+            FROM {}
+            WHERE guildID = ?
+            AND isReleased = 0;
+        '''.format(table_name)
+
+    entries = execute_query(query, (guild_id,), UnreleasedEntry)
+    return entries
+
+
+def update_values(media: Movie | Show) -> tuple:
+    return released(media.release_timestamp), media.release_timestamp, media.runtime, media.imdb_rating
+
+
+def next_refresh(is_released: int, release_time: int, now: int) -> int:
+    if is_released:
+        return now + RATING_REFRESH_INTERVAL
+
+    # Check the date shortly before release in case it moves, then again once it has passed
+    if release_time - RELEASE_LEAD > now:
+        return min(release_time - RELEASE_LEAD, now + UNRELEASED_REFRESH_INTERVAL)
+    if release_time > now:
+        return release_time + RELEASE_GRACE
+    return now + RELEASE_GRACE
+
+
+def get_due_refreshes(table_name: str, now: int, limit: int) -> list | None:
+    query = '''
+            SELECT guildID, simklID, isReleased, releaseTime, runtime, rating
+            FROM {}
+            WHERE watchedAt = 0
+            AND nextRefresh <= ?
+            ORDER BY nextRefresh
+            LIMIT ?;
+        '''.format(table_name)
+
+    rows = execute_query(query, (now, limit), DueRefresh)
+    return rows
+
+
+def get_refresh_queue(table_name: str, guild_id: int, limit: int) -> list | None:
+    query = '''
+            SELECT simklID, title, isReleased, nextRefresh
+            FROM {}
+            WHERE watchedAt = 0
+            AND guildID = ?
+            ORDER BY nextRefresh
+            LIMIT ?;
+        '''.format(table_name)
+
+    rows = execute_query(query, (guild_id, limit), QueuedRefresh)
+    return rows
+
+
+def reschedule(table_name: str, schedule: list[tuple[int, int, int]]) -> None:
+    query = '''
+            UPDATE {}
+            SET nextRefresh = ?
+            WHERE guildID = ?
+            AND simklID = ?;
+        '''.format(table_name)
+
+    commit_many(query, schedule)
+
+
+def update_entry(table_name: str, guild_id: int, media: Movie | Show) -> None:
     query = '''
             UPDATE {}
             SET isReleased = ?, releaseTime = ?, runtime = ?, rating = ?
-            WHERE simklID = ?;
+            WHERE guildID = ?
+            AND simklID = ?;
         '''.format(table_name)
 
-    commit_query(query, (released(media.release_timestamp), media.release_timestamp, media.runtime,
-                         media.imdb_rating, media.ids.simkl))
+    commit_query(query, (*update_values(media), guild_id, media.ids.simkl))
 
 
-###########################################
-# --------------) Remove (----------------#
-###########################################
+def update_entries(table_name: str, guild_id: int, entries: list[tuple[int, Movie | Show]]) -> None:
+    if not entries:
+        return
 
-def get_owned_entries(table_name: str, search_string: str, user_id: int) -> list[dict]:
     query = '''
-            SELECT simklID, title 
-            FROM {} 
-            WHERE LOWER(title) LIKE ?
-            AND userID = ?
-            LIMIT 25;
+            UPDATE {}
+            SET isReleased = ?, releaseTime = ?, runtime = ?, rating = ?
+            WHERE guildID = ?
+            AND simklID = ?;
         '''.format(table_name)
 
-    results = execute_query(query, (f'%{search_string.lower()}%', user_id))
+    # One transaction for the rows and their genres, however many titles changed
+    commit_batch([
+        (query, [(*update_values(media), guild_id, simkl_id) for simkl_id, media in entries]),
+        (STORE_GENRES, [row for _, media in entries for row in genre_values(table_name, media)]),
+    ])
+
+
+###########################################
+# --------------) Remove (----------------#
+###########################################
+
+def get_owned_entries(table_name: str, guild_id: int, search_string: str, user_id: int) -> list[dict]:
+    results = search_titles(table_name, guild_id, search_string, "userID = ?", (user_id,))
     return [
         {
             "name": title,
@@ -103,70 +567,124 @@ def get_owned_entries(table_name: str, search_string: str, user_id: int) -> list
     ]
 
 
-def remove_entry(table_name: str, simkl_id: int, user_id: int) -> None:
+def remove_entry(table_name: str, guild_id: int, simkl_id: int, user_id: int) -> None:
     query = '''
             DELETE FROM {}
-            WHERE simklID = ?
+            WHERE guildID = ?
+            AND simklID = ?
             AND userID = ?;
         '''.format(table_name)
 
-    commit_query(query, (simkl_id, user_id))
+    commit_query(query, (guild_id, simkl_id, user_id))
 
 
 ###########################################
 # -------------) To Watch (---------------#
 ###########################################
 
-def insert(media: Movie | Show, user_name: str, user_id: int) -> None:
+STORE_GENRES = '''
+        INSERT OR IGNORE INTO genres (tableName, genre, simklID)
+        VALUES (?, ?, ?);
+    '''
+
+
+def genre_values(table_name: str, media: Movie | Show) -> list[tuple]:
+    return [(table_name, genre, media.ids.simkl) for genre in media.genres or [] if genre != "N/A"]
+
+
+def insert(media: Movie | Show, guild_id: int, user_name: str, user_id: int) -> None:
     query = '''
-            INSERT INTO {} (simklID, imdbID, title, isReleased, releaseTime, runtime, rating, addedAt, userName, userID)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
+            INSERT INTO {} (guildID, simklID, imdbID, title, isReleased, releaseTime, runtime, rating, addedAt,
+                            userName, userID, nextRefresh)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
         '''.format(media.table_name)
 
-    commit_query(query, (media.ids.simkl, media.ids.imdb, media.title, released(media.release_timestamp),
-                         media.release_timestamp, media.runtime, media.imdb_rating, get_current_timestamp(),
-                         user_name, user_id))
+    now = get_current_timestamp()
+    is_released = released(media.release_timestamp)
+    # The row, its genres and its details land together, so a failure never leaves a half-written title
+    commit_batch([
+        (query, [(guild_id, media.ids.simkl, media.ids.imdb, media.title, is_released, media.release_timestamp,
+                  media.runtime, media.imdb_rating, now, user_name, user_id,
+                  next_refresh(is_released, media.release_timestamp, now))]),
+        (STORE_GENRES, genre_values(media.table_name, media)),
+        (STORE_DETAILS, [detail_values(media)]),
+    ])
 
 
-def get_to_watch_data(table_name: str) -> tuple:
+def get_genres(table_name: str, guild_id: int, search_string: str) -> list[dict]:
+    # Genres are shared by every guild listing a title, so only offer those with a title in this guild's /random pool
     query = '''
-            SELECT simklID, title, runtime, rating, isReleased, releaseTime 
-            FROM {} 
-            WHERE watchedAt = 0
-            ORDER BY addedAt ASC;
+            SELECT candidate.genre
+            FROM (
+                SELECT DISTINCT genre
+                FROM genres
+                WHERE tableName = ?
+                AND genre LIKE ?
+            ) AS candidate
+            WHERE EXISTS (
+                SELECT 1
+                FROM genres AS g
+                JOIN {} AS media
+                ON media.guildID = ?
+                AND media.simklID = g.simklID
+                WHERE g.tableName = ?
+                AND g.genre = candidate.genre
+                AND media.watchedAt = 0
+                AND media.isReleased = 1
+            )
+            LIMIT 25;
         '''.format(table_name)
 
-    results = execute_query(query)
-    titles, runtimes, ratings = [], [], []
+    results = execute_query(query, (table_name, f'%{search_string}%', guild_id, table_name))
+    return [
+        {
+            "name": genre,
+            "value": genre
+        }
+        for genre, in results
+    ]
 
-    for simkl_id, title, runtime, rating, is_released, release_time in results:
-        # TITLE: Avatar 5 (in 8 years)
-        title_output = [f"[{printable_title(title)}](https://simkl.com/{table_name}/{simkl_id}/)"]
-        if not is_released:
-            title_output.append(f"(<t:{release_time}:R>)")
-        titles.append(" ".join(title_output))
 
-        # RUNTIME: 1h 42m
-        runtimes.append(convert_minutes(runtime))
+def format_to_watch_row(table_name: str, simkl_id: int, title: str, runtime: int, rating: float,
+                        is_released: int, release_time: int) -> tuple[str, str, str]:
+    # TITLE: Avatar 5 (in 8 years)
+    title_output = [f"[{printable_title(title)}](https://simkl.com/{table_name}/{simkl_id}/)"]
+    if not is_released:
+        title_output.append(f"(<t:{release_time}:R>)")
 
-        # RATING: ★ 9.3
-        if float(rating):
-            ratings.append("★ {:.1f}".format(float(rating)))
-        else:
-            ratings.append("★ N/A")
+    # RATING: ★ 9.3
+    if float(rating):
+        rating_output = "★ {:.1f}".format(float(rating))
+    else:
+        rating_output = "★ N/A"
 
-    return titles, runtimes, ratings
+    # RUNTIME: 1h 42m
+    return " ".join(title_output), convert_minutes(runtime), rating_output
 
 
-def search_to_watch_titles(table_name: str, search_string: str) -> list[dict]:
+def get_to_watch_data(table_name: str, guild_id: int) -> tuple:
     query = '''
-            SELECT simklID, title 
+            SELECT simklID, title, runtime, rating, isReleased, releaseTime 
             FROM {} 
-            WHERE LOWER(title) LIKE ?
+            WHERE guildID = ?
             AND watchedAt = 0
-            LIMIT 25;
+            ORDER BY addedAt ASC;
         '''.format(table_name)
-    results = execute_query(query, (f'%{search_string.lower()}%',))
+
+    results = execute_query(query, (guild_id,))
+    titles, runtimes, ratings = [], [], []
+
+    for row in results:
+        title, runtime, rating = format_to_watch_row(table_name, *row)
+        titles.append(title)
+        runtimes.append(runtime)
+        ratings.append(rating)
+
+    return titles, runtimes, ratings
+
+
+def search_to_watch_titles(table_name: str, guild_id: int, search_string: str) -> list[dict]:
+    results = search_titles(table_name, guild_id, search_string, "watchedAt = 0", ())
 
     return [
         {
@@ -177,28 +695,96 @@ def search_to_watch_titles(table_name: str, search_string: str) -> list[dict]:
     ]
 
 
-def select_random_simkl_id(table_name: str) -> int:
+def search_known_titles(table_name: str, guild_id: int, search_string: str) -> list | None:
+    # Titles this guild has listed before, for when Simkl cannot answer in time; other guilds' lists stay private
+    search_string = search_string.strip().lower()
+    if len(search_string) < MIN_INDEXED_SEARCH:
+        return []
+
     query = '''
-            SELECT simklID 
-            FROM {} 
-            WHERE watchedAt = 0
-            AND isReleased = 1
-            ORDER BY RANDOM()
-            LIMIT 1;
+            SELECT media.simklID, media.title, details.year
+            FROM {0}Search AS search
+            JOIN {0} AS media ON media.rowid = search.rowid
+            LEFT JOIN details ON details.tableName = ? AND details.simklID = media.simklID
+            WHERE {0}Search MATCH ?
+            AND media.guildID = ?
+            ORDER BY instr(LOWER(media.title), ?) = 1 DESC, search.rank, LENGTH(media.title)
+            LIMIT 25;
         '''.format(table_name)
-    title, = execute_query(query)[0]
-    return title
+
+    phrase = '"{}"'.format(search_string.replace('"', '""'))
+    results = execute_query(query, (table_name, phrase, guild_id, search_string))
+    return results
 
 
-def get_to_watch_owner_data(table_name: str, simkl_id: int) -> list | None:
+def select_random_simkl_id(table_name: str, guild_id: int, max_runtime: int = None, min_rating: float = None,
+                           user_id: int = None, genre: str = None) -> int | None:
+    # With an owner, the (guildID, userID) index is far more selective than the runtime and rating ranges, so the
+    # ranges are kept off their indexes with a unary + and only filter the owner's rows
+    ranged = "+" if user_id is not None else ""
+    pool, pool_params = ["guildID = ?", "watchedAt = 0", "isReleased = 1"], [guild_id]
+    if user_id is not None:
+        pool.append("userID = ?")
+        pool_params.append(user_id)
+    conditions, params = list(pool), list(pool_params)
+    if max_runtime is not None:
+        conditions.append(f"{ranged}runtime BETWEEN 1 AND ?")
+        params.append(max_runtime)
+    if min_rating is not None:
+        conditions.append(f"{ranged}rating >= ?")
+        params.append(min_rating)
+    if genre is not None:
+        # Correlated, so each candidate is one primary key lookup instead of materialising the whole genre
+        conditions.append("EXISTS (SELECT 1 FROM genres WHERE tableName = ? AND genre = ? AND simklID = {}.simklID)"
+                          .format(table_name))
+        params.extend((table_name, genre))
+
+    where = " AND ".join(conditions)
+    bounds = "FROM {} WHERE {}".format(table_name, " AND ".join(pool))
+    lowest, highest = execute_query(
+        "SELECT (SELECT MIN(rowid) {0}), (SELECT MAX(rowid) {0});".format(bounds), (*pool_params, *pool_params)
+    )[0]
+    if lowest is None:
+        return None
+
+    # Rejection sampling: draw rowids uniformly from the pool's range and keep the first draw that is itself a
+    # qualifying row, so every row is equally likely. Each probe is a rowid seek whatever the list size, and the
+    # batches grow so sparse filters get more draws. The + keeps the planner on the rowids, not the guild's index
+    query = '''
+            SELECT rowid, simklID
+            FROM {}
+            WHERE rowid IN ({{}})
+            AND +{};
+        '''.format(table_name, where)
+    probes = RANDOM_PROBES
+    while probes <= RANDOM_MAX_PROBES:
+        draws = [random.randint(lowest, highest) for _ in range(probes)]
+        hits = dict(execute_query(query.format(", ".join("?" * probes)), (*draws, *params)))
+        for rowid in draws:
+            if rowid in hits:
+                return hits[rowid]
+        probes *= 4
+
+    # Sparse matches (tight filters, or a guild whose rows are spread among other guilds') fall back to reading the
+    # matching ids once, off the narrowest partial index, and choosing among them
+    simkl_ids = execute_query("SELECT simklID FROM {} WHERE {};".format(table_name, where), tuple(params))
+    if not simkl_ids:
+        return None
+
+    simkl_id, = random.choice(simkl_ids)
+    return simkl_id
+
+
+def get_to_watch_owner_data(table_name: str, guild_id: int, simkl_id: int) -> list | None:
     query = '''
             SELECT userID, addedAt
             FROM {}
-            WHERE simklID = ?
+            WHERE guildID = ?
+            AND simklID = ?
             AND watchedAt = 0;
         '''.format(table_name)
 
-    results = execute_query(query, (simkl_id,))
+    results = execute_query(query, (guild_id, simkl_id), OwnerData)
     return results
 
 
@@ -206,32 +792,84 @@ def get_to_watch_owner_data(table_name: str, simkl_id: int) -> list | None:
 # --------------) Watched (---------------#
 ###########################################
 
-def set_watched(table_name: str, simkl_id: int) -> None:
+def set_watched(table_name: str, guild_id: int, simkl_id: int) -> None:
     query = '''
             UPDATE {}
             SET watchedAt = ?
-            WHERE simklID = ?;
+            WHERE guildID = ?
+            AND simklID = ?;
         '''.format(table_name)
 
-    commit_query(query, (get_current_timestamp(), simkl_id))
+    commit_query(query, (get_current_timestamp(), guild_id, simkl_id))
+
+
+def format_watched_row(title: str, watched_at: int) -> tuple[str, str]:
+    return printable_title(title), f'<t:{watched_at}:R>'
 
 
-def get_watched_data(table_name: str) -> tuple[list[str], list[str], str]:
+def get_watched_data(table_name: str, guild_id: int) -> tuple[list[str], list[str], str]:
     query = '''
             SELECT title, watchedAt 
             FROM {} 
-            WHERE watchedAt != 0
-            ORDER BY title GLOB '[a-z]*' DESC, LOWER(title);
+            WHERE guildID = ?
+            AND watchedAt != 0
+            ORDER BY sortKey;
         '''.format(table_name)
-    results = execute_query(query)
+    results = execute_query(query, (guild_id,))
     titles, watched_at = [], []
 
     for title, watched_at_time in results:
-        titles.append(printable_title(title))
-        watched_at.append(f'<t:{watched_at_time}:R>')
+        title_output, watched_at_output = format_watched_row(title, watched_at_time)
+        titles.append(title_output)
+        watched_at.append(watched_at_output)
 
     return titles, watched_at, 'ㅤ'
 
 
+###########################################
+# -------------) List Views (-------------#
+###########################################
+
+def register_list_message(guild_id: int, name: str, channel_id: int, message_id: int) -> None:
+    query = '''
+            INSERT OR REPLACE INTO listMessages (guildID, name, channelID, messageID)
+            VALUES (?, ?, ?, ?);
+        '''
+
+    commit_query(query, (guild_id, name, channel_id, message_id))
+
+
+def get_list_messages() -> list | None:
+    query = '''
+            SELECT guildID, name, channelID, messageID
+            FROM listMessages;
+        '''
+
+    rows = execute_query(query, (), ListMessage)
+    return rows
+
+
+def get_view_rows(table_name: str) -> list | None:
+    query = '''
+            SELECT guildID, simklID, title, runtime, rating, isReleased, releaseTime, addedAt, watchedAt
+            FROM {};
+        '''.format(table_name)
+
+    rows = execute_query(query)
+    return rows
+
+
+def get_view_row(table_name: str, guild_id: int, simkl_id: int) -> tuple | None:
+    query = '''
+            SELECT simklID, title, runtime, rating, isReleased, releaseTime, addedAt, watchedAt
+            FROM {}
+            WHERE guildID = ?
+            AND simklID = ?;
+        '''.format(table_name)
+
+    rows = execute_query(query, (guild_id, simkl_id))
+    return rows[0] if rows else None
+
+
 if __name__ == '__main__':
     pass
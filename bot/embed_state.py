@@ -0,0 +1,181 @@
+import re
+import json
+import math
+from bisect import bisect_left, insort
+
+import interactions
+from database import MEDIA_TABLES, format_to_watch_row, format_watched_row
+from embeds import MainEmbed, ToWatchEmbed, WatchedEmbed
+
+
+###########################################
+# --------------) Rows (------------------#
+###########################################
+
+def to_watch_entry(table_name: str, row: tuple) -> tuple[tuple, tuple] | None:
+    simkl_id, title, runtime, rating, is_released, release_time, added_at, watched_at = row
+    if watched_at:
+        return None
+
+    return (added_at, simkl_id), (table_name, simkl_id, title, runtime, rating, is_released, release_time)
+
+
+def watched_entry(_table_name: str, row: tuple) -> tuple[tuple, tuple] | None:
+    simkl_id, title, *_, watched_at = row
+    if not watched_at:
+        return None
+
+    # Mirrors the sortKey column: titles starting with a lowercase letter first, then case-insensitive
+    sort_key = (not re.match("[a-z]", title), title.lower(), simkl_id)
+    return sort_key, (title, watched_at)
+
+
+###########################################
+# ------------) List View (---------------#
+###########################################
+
+class ListView:
+    def __init__(self, name: str, embed_class: type[MainEmbed], entry, format_row, page_size: int,
+                 blank_column: bool = False):
+        self.name = name
+        self.embed_class = embed_class
+        self.entry = entry
+        self.format_row = format_row
+        self.page_size = page_size
+        self.blank_column = blank_column
+        self.rows: dict[str, dict[int, tuple[tuple, tuple]]] = {table_name: {} for table_name in MEDIA_TABLES}
+        self.order: dict[str, list[tuple]] = {table_name: [] for table_name in MEDIA_TABLES}
+        self.versions: dict[str, int] = {table_name: 0 for table_name in MEDIA_TABLES}
+        self.pages: dict[int, interactions.Embed] = {}
+        self.page = 0
+        self.last_rendered: str | None = None
+
+    @property
+    def version(self) -> int:
+        return sum(self.versions.values())
+
+    @property
+    def page_count(self) -> int:
+        longest = max(len(order) for order in self.order.values())
+        return max(1, math.ceil(longest / self.page_size))
+
+    def load(self, table_name: str, rows: list[tuple]) -> None:
+        self.rows[table_name].clear()
+
+        for row in rows:
+            entry = self.entry(table_name, row)
+            if entry is not None:
+                self.rows[table_name][row[0]] = entry
+        self.order[table_name] = sorted(sort_key for sort_key, _ in self.rows[table_name].values())
+        self.versions[table_name] += 1
+        self.pages.clear()
+        self.turn(0)
+
+    def apply(self, table_name: str, simkl_id: int, row: tuple | None) -> bool:
+        new = self.entry(table_name, row) if row is not None else None
+        old = self.rows[table_name].get(simkl_id)
+        if new == old:
+            return False
+
+        page_count = self.page_count
+        order = self.order[table_name]
+        positions = []
+
+        if old is not None:
+            position = bisect_left(order, old[0])
+            order.pop(position)
+            positions.append(position)
+            del self.rows[table_name][simkl_id]
+        if new is not None:
+            positions.append(bisect_left(order, new[0]))
+            insort(order, new[0])
+            self.rows[table_name][simkl_id] = new
+
+        self.versions[table_name] += 1
+        self._invalidate(min(positions) // self.page_size if page_count == self.page_count else 0)
+        self.turn(0)
+        return True
+
+    def _invalidate(self, first_page: int) -> None:
+        # Pages before the first changed position keep their rows and can stay cached
+        for page in [page for page in self.pages if page >= first_page]:
+            del self.pages[page]
+
+    def _columns(self, table_name: str, page: int) -> tuple:
+        start = page * self.page_size
+        rows = self.rows[table_name]
+        rendered = [self.format_row(*rows[sort_key[-1]][1])
+                    for sort_key in self.order[table_name][start:start + self.page_size]]
+        columns = tuple(list(column) for column in zip(*rendered)) or ([], [], [])
+        if self.blank_column:
+            columns = columns[0], columns[1], 'ㅤ'
+        return columns
+
+    def build_page(self, page: int) -> interactions.Embed:
+        if page not in self.pages:
+            embed = self.embed_class(self._columns("movies", page), self._columns("tv", page)).build_embed()
+            if self.page_count > 1:
+                embed.set_footer(text=f"Page {page + 1}/{self.page_count}")
+            self.pages[page] = embed
+        return self.pages[page]
+
+    def build_embed(self) -> interactions.Embed:
+        return self.build_page(self.page)
+
+    def components(self) -> list[interactions.ActionRow]:
+        if self.page_count == 1:
+            return []
+
+        return [interactions.ActionRow(
+            interactions.Button(style=interactions.ButtonStyle.SECONDARY, label="◀",
+                                custom_id=f"page:{self.name}:prev", disabled=self.page == 0),
+            interactions.Button(style=interactions.ButtonStyle.SECONDARY, label="▶",
+                                custom_id=f"page:{self.name}:next", disabled=self.page >= self.page_count - 1),
+        )]
+
+    def turn(self, delta: int) -> None:
+        self.page = min(max(self.page + delta, 0), self.page_count - 1)
+
+    def render(self) -> tuple[interactions.Embed, list[interactions.ActionRow], bool]:
+        embed, components = self.build_embed(), self.components()
+        rendered = json.dumps([embed.to_dict(), [row.to_dict() for row in components]],
+                              sort_keys=True, ensure_ascii=False)
+        changed = rendered != self.last_rendered
+        self.last_rendered = rendered
+        return embed, components, changed
+
+    def forget_rendered(self) -> None:
+        self.last_rendered = None
+
+
+views: dict[int, dict[str, ListView]] = {}
+
+
+def views_for(guild_id: int) -> dict[str, ListView]:
+    guild_id = int(guild_id)
+    if guild_id not in views:
+        views[guild_id] = {
+            "to_watch": ListView("to_watch", ToWatchEmbed, to_watch_entry, format_to_watch_row, page_size=15),
+            "watched": ListView("watched", WatchedEmbed, watched_entry, format_watched_row, page_size=35,
+                                blank_column=True),
+        }
+    return views[guild_id]
+
+
+def load(table_name: str, rows: list[tuple]) -> None:
+    guild_rows: dict[int, list[tuple]] = {guild_id: [] for guild_id in views}
+    for guild_id, *row in rows:
+        guild_rows.setdefault(guild_id, []).append(row)
+
+    for guild_id, rows in guild_rows.items():
+        for view in views_for(guild_id).values():
+            view.load(table_name, rows)
+
+
+def apply(table_name: str, guild_id: int, simkl_id: int, row: tuple | None) -> None:
+    for view in views_for(guild_id).values():
+        view.apply(table_name, simkl_id, row)
+
+
+if __name__ == '__main__':
+    pass
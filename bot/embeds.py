@@ -12,10 +12,14 @@ def find_max_title_len(movie_titles: list[str], tv_titles: list[str] = None) ->
     if tv_titles is None:
         tv_titles = []
 
-    if "http" in movie_titles[0]:
-        return max(((len(title)-24) for title in (movie_titles + tv_titles)))
+    titles = movie_titles + tv_titles
+    if not titles:
+        return 0
 
-    return max(map(len, movie_titles + tv_titles))
+    if "http" in titles[0]:
+        return max(((len(title)-24) for title in titles))
+
+    return max(map(len, titles))
 
 
 ###########################################
@@ -0,0 +1,105 @@
+import os
+import asyncio
+
+import embed_state
+from log import get_logger
+from scheduling import FairScheduler
+
+UPDATE_WINDOW = float(os.getenv("LIST_UPDATE_WINDOW", 2))
+EDIT_CONCURRENCY = int(os.getenv("LIST_EDIT_CONCURRENCY", 4))
+MAX_BACKOFF = 60.0
+logger = get_logger("ListUpdater")
+
+
+###########################################
+# ------------) List Updater (------------#
+###########################################
+
+class ListMessage:
+    def __init__(self, guild_id: int, name: str, channel_id: int, message_id: int):
+        self.guild_id = guild_id
+        self.name = name
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.backoff = 0.0
+        self.retry_at = 0.0
+
+    @property
+    def view(self) -> embed_state.ListView:
+        return embed_state.views_for(self.guild_id)[self.name]
+
+
+class ListUpdater:
+    def __init__(self, window: float = UPDATE_WINDOW, concurrency: int = EDIT_CONCURRENCY):
+        self.window = window
+        self.messages: dict[tuple[int, str], ListMessage] = {}
+        self.dirty: set[tuple[int, str]] = set()
+        self.wake = asyncio.Event()
+        self.scheduler = FairScheduler(concurrency)
+        self.task: asyncio.Task | None = None
+        self.http = None
+
+    def register(self, guild_id: int, name: str, channel_id: int, message_id: int) -> None:
+        self.messages[(int(guild_id), name)] = ListMessage(int(guild_id), name, int(channel_id), int(message_id))
+
+    def start(self, http) -> None:
+        self.http = http
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.scheduler.stop()
+
+    def mark_dirty(self, guild_id: int, *names: str) -> None:
+        for name in names:
+            key = int(guild_id), name
+            if key in self.messages:
+                self.dirty.add(key)
+        self.wake.set()
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self.wake.wait()
+            # Let a burst of commands settle so each message is edited once per window
+            await asyncio.sleep(self.window)
+            self.wake.clear()
+
+            now = loop.time()
+            ready = {key for key in self.dirty if self.messages[key].retry_at <= now}
+            self.dirty -= ready
+            if self.dirty:
+                self.wake.set()
+
+            # Edits are queued per guild and served round-robin, so one busy guild cannot starve the rest
+            await asyncio.gather(*(self.scheduler.submit(key[0], lambda key=key: self.flush(key)) for key in ready),
+                                 return_exceptions=True)
+
+    async def flush(self, key: tuple[int, str]) -> None:
+        message = self.messages[key]
+        embed, components, changed = message.view.render()
+        if not changed:
+            return
+
+        payload = {"embeds": [embed.to_dict()], "components": [row.to_dict() for row in components]}
+        try:
+            await self.http.edit_message(payload, message.channel_id, message.message_id)
+            message.backoff = 0.0
+        except Exception as e:
+            # The HTTP client has already waited out any 429s, so whatever reaches here is worth a slower retry
+            message.view.forget_rendered()
+            message.backoff = min(max(message.backoff * 2, 1.0), MAX_BACKOFF)
+            message.retry_at = asyncio.get_running_loop().time() + message.backoff
+            logger.error(f"Failed to edit {message.name} list message in guild {message.guild_id}, "
+                         f"retrying in {message.backoff:.1f}s: {e!r}")
+            self.dirty.add(key)
+            self.wake.set()
+
+
+if __name__ == '__main__':
+    pass
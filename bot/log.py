@@ -1,10 +1,115 @@
+import os
+import json
+import time
+import queue
+import atexit
 import logging
+import logging.handlers
 
-logging.basicConfig(
-        format='%(asctime)s %(name)s %(levelname)-8s %(message)s',
-        datefmt='%m-%d-%Y %H:%M:%S',
-        level=logging.INFO,
-    )
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", 10))
+TEXT_FORMAT = '%(asctime)s %(name)s %(levelname)-8s %(message)s'
+DATE_FORMAT = '%m-%d-%Y %H:%M:%S'
+
+
+###########################################
+# -------------) Formatting (-------------#
+###########################################
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, DATE_FORMAT),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+class LazyJson:
+    # Only serialized if a handler actually formats the record, and then on the listener thread
+    def __init__(self, model):
+        self.model = model
+
+    def __str__(self) -> str:
+        return json.dumps(self.model.model_dump(), indent=4, default=str)
+
+
+###########################################
+# ------------) Rate Limiting (-----------#
+###########################################
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.windows: dict[tuple[str, object], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Warnings and errors always get through; chatty lines are capped per message template
+        if record.levelno >= logging.WARNING or not self.limit:
+            return True
+
+        now = time.monotonic()
+        if len(self.windows) > 4096:
+            # Pre-formatted messages are all distinct templates, so forget the ones that have gone quiet
+            self.windows = {key: state for key, state in self.windows.items() if now - state[0] < self.window}
+
+        key = record.name, record.msg
+        state = self.windows.get(key)
+        if state is None or now - state[0] >= self.window:
+            suppressed = state[2] if state else 0
+            self.windows[key] = [now, 1, 0]
+            if suppressed:
+                record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+            return True
+
+        if state[1] < self.limit:
+            state[1] += 1
+            return True
+
+        state[2] += 1
+        return False
+
+
+class LoopQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Skip the default eager formatting; the listener thread formats (and evaluates lazy args) instead
+        return record
+
+
+###########################################
+# --------------) Configure (-------------#
+###########################################
+
+def configure() -> logging.handlers.QueueListener:
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JsonFormatter())
+    else:
+        stream.setFormatter(logging.Formatter(TEXT_FORMAT, datefmt=DATE_FORMAT))
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = LoopQueueHandler(records)
+    handler.addFilter(RateLimitFilter())
+
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(LOG_LEVEL)
+
+    listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+listener = configure()
 
 
 def get_logger(name: str = "Logger") -> logging.Logger:
@@ -0,0 +1,244 @@
+import os
+import time
+import asyncio
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+from aiohttp import web
+from log import get_logger
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+# 50us doubling up to ~26s covers both SQLite lookups and slow Simkl calls with one bucket layout
+BUCKETS = tuple(0.00005 * 2 ** i for i in range(20))
+logger = get_logger("Metrics")
+
+
+###########################################
+# -------------) Histogram (--------------#
+###########################################
+
+class Histogram:
+    __slots__ = ("counts", "count", "total")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+
+        # Interpolate inside the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return BUCKETS[-1]
+
+
+###########################################
+# --------------) Registry (--------------#
+###########################################
+
+Labels = tuple[tuple[str, str], ...]
+lock = threading.Lock()
+histograms: dict[str, dict[Labels, Histogram]] = {}
+counters: dict[str, dict[Labels, float]] = {}
+gauges: dict[str, Callable[[], dict[str, float]]] = {}
+
+
+def histogram_for(name: str, **labels: str) -> Histogram:
+    key = tuple(sorted(labels.items()))
+    with lock:
+        series = histograms.setdefault(name, {})
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        return histogram
+
+
+def observe(name: str, seconds: float, **labels: str) -> None:
+    histogram = histogram_for(name, **labels)
+    with lock:
+        histogram.observe(seconds)
+
+
+def increment(name: str, amount: float = 1, **labels: str) -> None:
+    key = tuple(sorted(labels.items()))
+    with lock:
+        series = counters.setdefault(name, {})
+        series[key] = series.get(key, 0) + amount
+
+
+def register_gauges(name: str, read: Callable[[], dict[str, float]]) -> None:
+    gauges[name] = read
+
+
+@contextmanager
+def timer(name: str, **labels: str):
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        increment(f"{name}_errors", **labels)
+        raise
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+def timed(name: str, **labels: str):
+    # The series is resolved once here so each call costs two clock reads and one locked update
+    def decorator(func):
+        histogram = histogram_for(name, **labels)
+
+        def record(start: float) -> None:
+            elapsed = time.perf_counter() - start
+            with lock:
+                histogram.observe(elapsed)
+
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                except BaseException:
+                    increment(f"{name}_errors", **labels)
+                    raise
+                finally:
+                    record(start)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                except BaseException:
+                    increment(f"{name}_errors", **labels)
+                    raise
+                finally:
+                    record(start)
+
+        return wrapper
+
+    return decorator
+
+
+def snapshot() -> tuple[dict, dict, dict]:
+    with lock:
+        histogram_copy = {name: {key: (list(h.counts), h.count, h.total) for key, h in series.items()}
+                          for name, series in histograms.items()}
+        counter_copy = {name: dict(series) for name, series in counters.items()}
+
+    gauge_values = {}
+    for name, read in gauges.items():
+        try:
+            gauge_values[name] = read()
+        except Exception as e:
+            logger.error(f"Failed to read {name} gauges: {e}")
+    return histogram_copy, counter_copy, gauge_values
+
+
+def restore(counts: list[int], count: int, total: float) -> Histogram:
+    histogram = Histogram()
+    histogram.counts, histogram.count, histogram.total = counts, count, total
+    return histogram
+
+
+def summarize(name: str) -> list[tuple[Labels, int, float, float, float]]:
+    # (labels, count, p50, p95, p99) per series, busiest first
+    histogram_copy, _, _ = snapshot()
+    rows = []
+    for key, state in histogram_copy.get(name, {}).items():
+        histogram = restore(*state)
+        if not histogram.count:
+            continue
+        rows.append((key, histogram.count, histogram.quantile(0.5), histogram.quantile(0.95),
+                     histogram.quantile(0.99)))
+    return sorted(rows, key=lambda row: row[1], reverse=True)
+
+
+###########################################
+# -------------) Prometheus (-------------#
+###########################################
+
+def format_labels(key: Labels, extra: str = "") -> str:
+    parts = [f'{label}="{value}"' for label, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def render_prometheus() -> str:
+    histogram_copy, counter_copy, gauge_values = snapshot()
+    lines = []
+
+    for name, series in sorted(histogram_copy.items()):
+        lines.append(f"# TYPE movienights_{name} histogram")
+        for key, (counts, count, total) in series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, counts):
+                cumulative += bucket_count
+                bucket_labels = format_labels(key, 'le="%g"' % bound)
+                lines.append(f"movienights_{name}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = format_labels(key, 'le="+Inf"')
+            lines.append(f"movienights_{name}_bucket{bucket_labels} {count}")
+            lines.append(f"movienights_{name}_sum{format_labels(key)} {total}")
+            lines.append(f"movienights_{name}_count{format_labels(key)} {count}")
+
+    for name, series in sorted(counter_copy.items()):
+        lines.append(f"# TYPE movienights_{name}_total counter")
+        for key, value in series.items():
+            lines.append(f"movienights_{name}_total{format_labels(key)} {value}")
+
+    for name, values in sorted(gauge_values.items()):
+        for field, value in values.items():
+            if isinstance(value, (int, float)):
+                lines.append(f"# TYPE movienights_{name}_{field} gauge")
+                lines.append(f"movienights_{name}_{field} {value}")
+
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    def __init__(self, host: str = METRICS_HOST, port: int = METRICS_PORT):
+        self.host = host
+        self.port = port
+        self.runner: web.AppRunner | None = None
+
+    async def start(self) -> None:
+        if not self.port or self.runner is not None:
+            return
+
+        async def handle(_request):
+            return web.Response(text=render_prometheus(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+if __name__ == '__main__':
+    pass
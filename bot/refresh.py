@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+from typing import Callable
+
+import simkl
+import async_database as db
+from log import get_logger
+from croniter import croniter
+from database import MEDIA_TABLES, next_refresh
+from scheduling import FairScheduler
+from validation import Movie, Show, get_current_timestamp
+
+REFRESH_CRON = os.getenv("REFRESH_CRON", "*/10 * * * *")
+REFRESH_BATCH = int(os.getenv("REFRESH_BATCH", 40))
+RETRY_DELAY = 3600
+BACKFILL_GUILD_ID = -1  # backfill fetches queue as one more guild, on a key no Discord snowflake can take
+logger = get_logger("Refresh")
+
+
+###########################################
+# ----------) Refresh Schedule (----------#
+###########################################
+
+class RefreshScheduler:
+    def __init__(self, fetch_scheduler: FairScheduler, on_change: Callable[[int], None],
+                 cron: str = REFRESH_CRON, batch_size: int = REFRESH_BATCH):
+        self.fetch_scheduler = fetch_scheduler
+        self.on_change = on_change
+        self.cron = cron
+        self.batch_size = batch_size
+        self.next_run: float | None = None
+        self.last_summary: dict[str, int] = {}
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def run(self) -> None:
+        while True:
+            self.next_run = croniter(self.cron, time.time()).get_next(float)
+            await asyncio.sleep(max(0.0, self.next_run - time.time()))
+
+            try:
+                self.last_summary = await self.tick()
+            except Exception as e:
+                logger.error(f"Scheduled refresh failed: {e}")
+
+    async def tick(self) -> dict[str, int]:
+        # A fixed batch per tick keeps Simkl load flat; anything left over stays due for the next tick
+        summary = {"refreshed": 0, "changed": 0, "failed": 0}
+        for table_name in MEDIA_TABLES:
+            for key, value in (await self.refresh_table(table_name)).items():
+                summary[key] += value
+
+        if any(summary.values()):
+            logger.info(f"Scheduled refresh: {summary}")
+        return summary
+
+    async def refresh_table(self, table_name: str) -> dict[str, int]:
+        now = get_current_timestamp()
+        due: dict[int, list[tuple]] = {}
+        for guild_id, simkl_id, *values in await db.get_due_refreshes(table_name, now, self.batch_size):
+            due.setdefault(simkl_id, []).append((guild_id, tuple(values)))
+
+        # The same title listed in several guilds is fetched once
+        simkl_ids = list(due)
+        fetched = await asyncio.gather(*(
+            self.fetch_scheduler.submit(due[simkl_id][0][0],
+                                        lambda simkl_id=simkl_id: simkl.id_to_object(table_name, simkl_id, fresh=True))
+            for simkl_id in simkl_ids
+        ), return_exceptions=True)
+
+        summary = {"refreshed": 0, "changed": 0, "failed": 0}
+        updates: dict[int, list[tuple[int, Movie | Show]]] = {}
+        schedule: list[tuple[int, int, int]] = []
+
+        for simkl_id, media in zip(simkl_ids, fetched):
+            for guild_id, old_values in due[simkl_id]:
+                if media is None or isinstance(media, Exception):
+                    summary["failed"] += 1
+                    schedule.append((now + RETRY_DELAY, guild_id, simkl_id))
+                    continue
+
+                values = db.update_values(media)
+                summary["refreshed"] += 1
+                schedule.append((next_refresh(values[0], values[1], now), guild_id, simkl_id))
+                if values != old_values:
+                    summary["changed"] += 1
+                    updates.setdefault(guild_id, []).append((simkl_id, media))
+
+        # Metadata is stored for every fetched title, so previews stay current even when list values did not change
+        await db.store_details([media for media in fetched if isinstance(media, (Movie, Show))])
+        for guild_id, entries in updates.items():
+            await db.update_entries(table_name, guild_id, entries)
+            self.on_change(guild_id)
+        await db.reschedule(table_name, schedule)
+
+        return summary
+
+
+###########################################
+# ------------) Detail Backfill (---------#
+###########################################
+
+async def backfill_details(fetch_scheduler: FairScheduler, batch_size: int = REFRESH_BATCH) -> dict[str, int]:
+    # Progress lives in the details table itself, so an interrupted backfill resumes with whatever is still missing
+    start = time.perf_counter()
+    summary = {"stored": 0, "failed": 0}
+
+    for table_name in MEDIA_TABLES:
+        after = 0
+        while batch := await db.get_missing_details(table_name, after, batch_size):
+            simkl_ids = [simkl_id for simkl_id, in batch]
+            fetched = await asyncio.gather(*(
+                fetch_scheduler.submit(BACKFILL_GUILD_ID,
+                                       lambda simkl_id=simkl_id: simkl.id_to_object(table_name, simkl_id))
+                for simkl_id in simkl_ids
+            ), return_exceptions=True)
+
+            medias = [media for media in fetched if isinstance(media, (Movie, Show))]
+            await db.store_details(medias)
+            summary["stored"] += len(medias)
+            summary["failed"] += len(simkl_ids) - len(medias)
+            after = simkl_ids[-1]
+
+    if any(summary.values()):
+        logger.info(f"Backfilled title details in {time.perf_counter() - start:.1f}s: {summary}")
+    return summary
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,116 @@
+import time
+import random
+import asyncio
+from typing import Any, Awaitable, Callable
+
+import metrics
+
+
+###########################################
+# ------------) Token Bucket (------------#
+###########################################
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def pause(self, seconds: float) -> None:
+        # A 429 applies to every caller, not just the request that received it
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens are handed out first come first served
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+###########################################
+# -----------) Circuit Breaker (----------#
+###########################################
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probing = False
+
+        # Half open lets a single probe through; its outcome decides whether the circuit closes again
+        if self.state == self.HALF_OPEN and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    # Full jitter keeps retries from many callers from lining up into synchronized bursts
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+###########################################
+# --------------) Deadlines (-------------#
+###########################################
+
+async def within_deadline(work: Awaitable, budget: float, fallback: Callable[[], Awaitable[tuple[Any, str]]],
+                          background: set[asyncio.Task], handler: str) -> Any:
+    task = asyncio.ensure_future(work)
+    done, _ = await asyncio.wait({task}, timeout=budget)
+    if done:
+        return task.result()
+
+    # Left running so a late answer still fills the cache; the owner of background cancels it on shutdown
+    background.add(task)
+    task.add_done_callback(background.discard)
+    task.add_done_callback(lambda finished: finished.cancelled() or finished.exception())
+    metrics.increment("deadline_misses", handler=handler)
+
+    result, source = await fallback()
+    metrics.increment("deadline_fallbacks", handler=handler, source=source)
+    return result
+
+
+if __name__ == '__main__':
+    pass
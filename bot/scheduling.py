@@ -0,0 +1,73 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable
+
+
+###########################################
+# ----------) Fair Scheduler (------------#
+###########################################
+
+class FairScheduler:
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.queues: OrderedDict[int, deque[tuple[Callable[[], Awaitable], asyncio.Future]]] = OrderedDict()
+        self.workers: set[asyncio.Task] = set()
+
+    def pending(self, guild_id: int) -> int:
+        return len(self.queues.get(guild_id, ()))
+
+    def submit(self, guild_id: int, job: Callable[[], Awaitable]) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.queues.setdefault(guild_id, deque()).append((job, future))
+
+        if len(self.workers) < self.concurrency:
+            self.workers.add(asyncio.create_task(self._work()))
+        return future
+
+    def _next(self) -> tuple[Callable[[], Awaitable], asyncio.Future]:
+        # Round-robin: a guild that just had a job served goes to the back of the line
+        guild_id, queue = next(iter(self.queues.items()))
+        job = queue.popleft()
+        if queue:
+            self.queues.move_to_end(guild_id)
+        else:
+            del self.queues[guild_id]
+        return job
+
+    async def _work(self) -> None:
+        try:
+            while self.queues:
+                job, future = self._next()
+                if future.cancelled():
+                    continue
+
+                try:
+                    result: Any = await job()
+                except asyncio.CancelledError:
+                    future.cancel()
+                    raise
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # Leave the pool in the same step that finds the queues empty; a done-callback would run a loop
+            # iteration later, and a submit in between would see a full pool and start no worker
+            self.workers.discard(asyncio.current_task())
+
+    async def stop(self) -> None:
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+        # Whoever is awaiting a job that will now never run gets a CancelledError instead of waiting forever
+        for queue in self.queues.values():
+            for _, future in queue:
+                future.cancel()
+        self.queues.clear()
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,267 @@
+import os
+import sqlite3
+from log import get_logger
+from database import MEDIA_TABLES, RATING_REFRESH_INTERVAL, get_connection, execute_query
+
+logger = get_logger("Schema")
+
+
+###########################################
+# ------------) Migrations (--------------#
+###########################################
+
+def per_table(template: str) -> str:
+    return "".join(template.format(table_name) for table_name in MEDIA_TABLES)
+
+
+def media_tables() -> str:
+    return per_table('''
+        CREATE TABLE IF NOT EXISTS {0} (
+            simklID INTEGER NOT NULL,
+            imdbID TEXT,
+            title TEXT NOT NULL,
+            isReleased INTEGER NOT NULL DEFAULT 0,
+            releaseTime INTEGER NOT NULL DEFAULT 0,
+            runtime INTEGER NOT NULL DEFAULT 0,
+            rating REAL NOT NULL DEFAULT 0,
+            addedAt INTEGER NOT NULL DEFAULT 0,
+            userName TEXT,
+            userID INTEGER,
+            watchedAt INTEGER NOT NULL DEFAULT 0
+        );
+
+        DELETE FROM {0}
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM {0} GROUP BY simklID);
+
+        CREATE UNIQUE INDEX IF NOT EXISTS {0}SimklID ON {0} (simklID);
+    ''')
+
+
+def cache_tables() -> str:
+    return '''
+        CREATE TABLE IF NOT EXISTS simklCache (
+            mediaType TEXT NOT NULL,
+            simklID INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            fetchedAt INTEGER NOT NULL,
+            PRIMARY KEY (mediaType, simklID)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS genres (
+            tableName TEXT NOT NULL,
+            genre TEXT NOT NULL,
+            simklID INTEGER NOT NULL,
+            PRIMARY KEY (tableName, genre, simklID)
+        ) WITHOUT ROWID;
+    '''
+
+
+def search_index() -> str:
+    return per_table('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {0}Search
+        USING fts5(title, content='{0}', content_rowid='rowid', tokenize='trigram');
+
+        CREATE TRIGGER IF NOT EXISTS {0}SearchInsert AFTER INSERT ON {0} BEGIN
+            INSERT INTO {0}Search (rowid, title) VALUES (new.rowid, new.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {0}SearchDelete AFTER DELETE ON {0} BEGIN
+            INSERT INTO {0}Search ({0}Search, rowid, title) VALUES ('delete', old.rowid, old.title);
+        END;
+        CREATE TRIGGER IF NOT EXISTS {0}SearchUpdate AFTER UPDATE OF title ON {0} BEGIN
+            INSERT INTO {0}Search ({0}Search, rowid, title) VALUES ('delete', old.rowid, old.title);
+            INSERT INTO {0}Search (rowid, title) VALUES (new.rowid, new.title);
+        END;
+
+        INSERT INTO {0}Search ({0}Search) VALUES ('rebuild');
+    ''')
+
+
+def random_indexes() -> str:
+    return per_table('''
+        CREATE INDEX IF NOT EXISTS {0}RandomRuntime ON {0} (runtime) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX IF NOT EXISTS {0}RandomRating ON {0} (rating) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX IF NOT EXISTS {0}RandomUser ON {0} (userID) WHERE watchedAt = 0 AND isReleased = 1;
+    ''')
+
+
+def query_indexes() -> str:
+    # sortKey stores ORDER BY title GLOB '[a-z]*' DESC, LOWER(title) as one indexable value
+    return per_table('''
+        ALTER TABLE {0} ADD COLUMN sortKey TEXT NOT NULL DEFAULT '';
+
+        UPDATE {0}
+        SET sortKey = (CASE WHEN title GLOB '[a-z]*' THEN '0' ELSE '1' END) || LOWER(title);
+
+        CREATE TRIGGER IF NOT EXISTS {0}SortKeyInsert AFTER INSERT ON {0} BEGIN
+            UPDATE {0}
+            SET sortKey = (CASE WHEN new.title GLOB '[a-z]*' THEN '0' ELSE '1' END) || LOWER(new.title)
+            WHERE rowid = new.rowid;
+        END;
+        CREATE TRIGGER IF NOT EXISTS {0}SortKeyUpdate AFTER UPDATE OF title ON {0} BEGIN
+            UPDATE {0}
+            SET sortKey = (CASE WHEN new.title GLOB '[a-z]*' THEN '0' ELSE '1' END) || LOWER(new.title)
+            WHERE rowid = new.rowid;
+        END;
+
+        CREATE INDEX IF NOT EXISTS {0}ToWatch
+        ON {0} (addedAt, simklID, title, runtime, rating, isReleased, releaseTime, watchedAt) WHERE watchedAt = 0;
+
+        CREATE INDEX IF NOT EXISTS {0}Watched
+        ON {0} (sortKey, title, watchedAt) WHERE watchedAt != 0;
+
+        CREATE INDEX IF NOT EXISTS {0}Unreleased
+        ON {0} (simklID, isReleased, releaseTime, runtime, rating) WHERE isReleased = 0;
+
+        CREATE INDEX IF NOT EXISTS {0}Owner ON {0} (userID, title, simklID);
+    ''')
+
+
+def guild_partitions() -> str:
+    # Rows from the single-guild era belong to the guild that owned the original list messages
+    legacy_guild_id = int(os.getenv("LEGACY_GUILD_ID", 0))
+    if not legacy_guild_id and any(execute_query(f"SELECT EXISTS (SELECT 1 FROM {table_name});")[0][0]
+                                   for table_name in MEDIA_TABLES):
+        # Guild 0 is never queried, so the existing rows would disappear from every list
+        raise RuntimeError("LEGACY_GUILD_ID must be set to migrate an existing single-guild database")
+
+    return per_table('''
+        ALTER TABLE {0} ADD COLUMN guildID INTEGER NOT NULL DEFAULT 0;
+        UPDATE {0} SET guildID = %d;
+
+        DROP INDEX IF EXISTS {0}SimklID;
+        DROP INDEX IF EXISTS {0}RandomRuntime;
+        DROP INDEX IF EXISTS {0}RandomRating;
+        DROP INDEX IF EXISTS {0}RandomUser;
+        DROP INDEX IF EXISTS {0}ToWatch;
+        DROP INDEX IF EXISTS {0}Watched;
+        DROP INDEX IF EXISTS {0}Unreleased;
+        DROP INDEX IF EXISTS {0}Owner;
+
+        CREATE UNIQUE INDEX {0}GuildSimklID ON {0} (guildID, simklID);
+        CREATE INDEX {0}RandomPool ON {0} (guildID) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX {0}RandomRuntime ON {0} (guildID, runtime) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX {0}RandomRating ON {0} (guildID, rating) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX {0}RandomUser ON {0} (guildID, userID) WHERE watchedAt = 0 AND isReleased = 1;
+        CREATE INDEX {0}ToWatch
+        ON {0} (guildID, addedAt, simklID, title, runtime, rating, isReleased, releaseTime, watchedAt)
+        WHERE watchedAt = 0;
+        CREATE INDEX {0}Watched ON {0} (guildID, sortKey, title, watchedAt) WHERE watchedAt != 0;
+        CREATE INDEX {0}Unreleased
+        ON {0} (guildID, simklID, isReleased, releaseTime, runtime, rating) WHERE isReleased = 0;
+        CREATE INDEX {0}Owner ON {0} (guildID, userID, title, simklID);
+    ''' % legacy_guild_id) + '''
+        CREATE TABLE IF NOT EXISTS listMessages (
+            guildID INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            channelID INTEGER NOT NULL,
+            messageID INTEGER NOT NULL,
+            PRIMARY KEY (guildID, name)
+        ) WITHOUT ROWID;
+    '''
+
+
+def refresh_schedule() -> str:
+    # Spread the existing rows over one rating cycle so the first cycle does not arrive as a single burst
+    return per_table('''
+        ALTER TABLE {0} ADD COLUMN nextRefresh INTEGER NOT NULL DEFAULT 0;
+        UPDATE {0} SET nextRefresh = CAST(strftime('%%s', 'now') AS INTEGER) + rowid * 7919 %% %d;
+
+        CREATE INDEX {0}NextRefresh
+        ON {0} (nextRefresh, guildID, simklID, title, isReleased, releaseTime, runtime, rating)
+        WHERE watchedAt = 0;
+    ''' % RATING_REFRESH_INTERVAL)
+
+
+def media_details() -> str:
+    # Keyed by title rather than guild: every guild listing a title shares one copy of its metadata
+    return '''
+        CREATE TABLE IF NOT EXISTS details (
+            tableName TEXT NOT NULL,
+            simklID INTEGER NOT NULL,
+            year INTEGER,
+            poster TEXT,
+            overview TEXT,
+            genres TEXT NOT NULL DEFAULT '[]',
+            certification TEXT,
+            released TEXT,
+            director TEXT,
+            budget INTEGER,
+            revenue INTEGER,
+            totalEpisodes INTEGER,
+            status TEXT,
+            network TEXT,
+            updatedAt INTEGER NOT NULL,
+            PRIMARY KEY (tableName, simklID)
+        ) WITHOUT ROWID;
+    '''
+
+
+def search_cache() -> str:
+    return '''
+        CREATE TABLE IF NOT EXISTS searchCache (
+            searchID TEXT NOT NULL PRIMARY KEY,
+            results BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            fetchedAt INTEGER NOT NULL,
+            usedAt INTEGER NOT NULL
+        ) WITHOUT ROWID;
+    '''
+
+
+def search_coverage() -> str:
+    # Rows cached before this knew nothing about truncation, so they count as incomplete
+    return '''
+        ALTER TABLE searchCache ADD COLUMN complete INTEGER NOT NULL DEFAULT 0;
+    '''
+
+
+def refresh_queue_index() -> str:
+    # The global NextRefresh index serves the scheduler; /refresh_queue reads one guild's upcoming titles in order
+    return per_table('''
+        CREATE INDEX {0}GuildNextRefresh ON {0} (guildID, nextRefresh, simklID, title, isReleased) WHERE watchedAt = 0;
+    ''')
+
+
+# Append only: a migration's position is its schema version
+MIGRATIONS = [
+    media_tables,
+    cache_tables,
+    search_index,
+    random_indexes,
+    query_indexes,
+    guild_partitions,
+    refresh_schedule,
+    media_details,
+    search_cache,
+    search_coverage,
+    refresh_queue_index,
+]
+
+
+###########################################
+# --------------) Migrate (---------------#
+###########################################
+
+def schema_version() -> int:
+    version, = execute_query("PRAGMA user_version;")[0]
+    return version
+
+
+def migrate() -> int:
+    version = schema_version()
+
+    for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with get_connection() as db:
+            try:
+                db.executescript(f"BEGIN;\n{migration()}\nPRAGMA user_version = {target};\nCOMMIT;")
+            except sqlite3.Error:
+                db.rollback()
+                raise
+        logger.info(f"Migrated schema to version {target} ({migration.__name__})")
+
+    return len(MIGRATIONS)
+
+
+if __name__ == '__main__':
+    migrate()
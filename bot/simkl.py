@@ -1,74 +1,321 @@
-import json
 import os
+import re
+import json
+import time
+import asyncio
 
 import aiohttp
 import pydantic
-from log import get_logger
+import metrics
+from log import LazyJson, get_logger
+from cache import DetailCache, SearchCache
 from dotenv import load_dotenv
-from cachetools import TTLCache
 from validation import Movie, Show
+from resilience import TokenBucket, CircuitBreaker, backoff_delay
 
 load_dotenv()
 
 API_URL = "https://api.simkl.com"
 CLIENT_ID = os.getenv("SIMKL_CLIENT_ID")
-cache = TTLCache(maxsize=100, ttl=300)
+SEARCH_LIMIT = int(os.getenv("SEARCH_LIMIT", 50))  # Simkl's maximum page size
+MAX_CHOICES = 25  # Discord's cap on autocomplete choices
+PREFIX_REFINEMENT = os.getenv("SEARCH_PREFIX_REFINEMENT", "1") == "1"
+search_cache = SearchCache.from_env()
+detail_cache = DetailCache.from_env()
+search_counters = {"upstream": 0, "coalesced": 0, "cancelled": 0, "refined": 0, "refined_upstream": 0}
+inflight_searches: dict[str, asyncio.Task] = {}
+user_searches: dict[int, tuple[int, asyncio.Future]] = {}
 logger = get_logger("Simkl")
+metrics.register_gauges("detail_cache", lambda: detail_cache.stats())
+metrics.register_gauges("search", lambda: dict(search_counters))
+metrics.register_gauges("search_cache", lambda: search_cache.stats())
+
+
+###########################################
+# --------------) Client (----------------#
+###########################################
+
+class SimklUnavailable(Exception):
+    pass
+
+
+def parse_retry_after(value: str | None) -> float:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class SimklClient:
+    def __init__(self, base_url: str = API_URL, connections_per_host: int = 8, keepalive_timeout: float = 30,
+                 dns_cache_ttl: int = 300, connect_timeout: float = 3, total_timeout: float = 10,
+                 rate: float = 5, burst: int = 10, max_retries: int = 3, retry_base: float = 0.5,
+                 retry_cap: float = 8, breaker_threshold: int = 5, breaker_reset: float = 30):
+        self.base_url = base_url
+        self.connections_per_host = connections_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = aiohttp.ClientTimeout(total=total_timeout, sock_connect=connect_timeout)
+        self.session: aiohttp.ClientSession | None = None
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_reset)
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.counters = {"requests": 0, "retries": 0, "rate_limited": 0, "failures": 0, "short_circuited": 0}
+
+    @classmethod
+    def from_env(cls) -> "SimklClient":
+        return cls(
+            base_url=os.getenv("SIMKL_API_URL", API_URL),
+            connections_per_host=int(os.getenv("SIMKL_CONNECTIONS_PER_HOST", 8)),
+            keepalive_timeout=float(os.getenv("SIMKL_KEEPALIVE_TIMEOUT", 30)),
+            dns_cache_ttl=int(os.getenv("SIMKL_DNS_CACHE_TTL", 300)),
+            connect_timeout=float(os.getenv("SIMKL_CONNECT_TIMEOUT", 3)),
+            total_timeout=float(os.getenv("SIMKL_TOTAL_TIMEOUT", 10)),
+            rate=float(os.getenv("SIMKL_RATE", 5)),
+            burst=int(os.getenv("SIMKL_BURST", 10)),
+            max_retries=int(os.getenv("SIMKL_MAX_RETRIES", 3)),
+            breaker_threshold=int(os.getenv("SIMKL_BREAKER_THRESHOLD", 5)),
+            breaker_reset=float(os.getenv("SIMKL_BREAKER_RESET", 30)),
+        )
+
+    @property
+    def available(self) -> bool:
+        return self.breaker.state == CircuitBreaker.CLOSED
+
+    def stats(self) -> dict[str, int | str]:
+        return {**self.counters, "breaker": self.breaker.state}
+
+    @property
+    def closed(self) -> bool:
+        return self.session is None or self.session.closed
+
+    async def start(self) -> None:
+        if not self.closed:
+            return
+
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.connections_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        logger.info(f"Opened Simkl session ({self.connections_per_host} connections per host)")
+
+    async def close(self) -> None:
+        if self.closed:
+            return
+
+        await self.session.close()
+        self.session = None
+        logger.info("Closed Simkl session")
+
+    async def get(self, endpoint: str) -> dict | list:
+        raw = await self.get_raw(endpoint)
+        return json.loads(raw) if raw else {}
+
+    async def get_raw(self, endpoint: str) -> bytes:
+        # Lazily open the pool so one-off scripts work without an explicit start()
+        if self.closed:
+            await self.start()
+
+        url = self.base_url + endpoint
+        label = endpoint.split("?")[0].split("/")[1]
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self.counters["short_circuited"] += 1
+                raise SimklUnavailable("Simkl circuit is open")
+
+            await self.bucket.acquire()
+            self.counters["requests"] += 1
+            delay = backoff_delay(attempt, self.retry_base, self.retry_cap)
+            start = time.perf_counter()
+            status = "error"
+            try:
+                async with self.session.get(url) as response:
+                    status = f"{response.status // 100}xx" if response.status != 429 else "429"
+                    if response.status == 429:
+                        # Rate limiting means Simkl is up; the bucket holds every caller back for Retry-After
+                        self.breaker.record_success()
+                        self.counters["rate_limited"] += 1
+                        self.bucket.pause(parse_retry_after(response.headers.get("Retry-After")) or delay)
+                        delay = 0.0
+                        reason = "rate limited"
+                    elif response.status >= 500:
+                        self.breaker.record_failure()
+                        reason = f"status {response.status}"
+                    else:
+                        self.breaker.record_success()
+                        response.raise_for_status()
+                        return await response.read()
+
+            except aiohttp.ClientResponseError as e:
+                logger.error(f"HTTP error occurred: {e}")
+                return b""
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                reason = str(e) or type(e).__name__
+            finally:
+                metrics.observe("simkl_request_seconds", time.perf_counter() - start, endpoint=label)
+                metrics.increment("simkl_requests", endpoint=label, status=status)
+
+            if attempt < self.max_retries:
+                self.counters["retries"] += 1
+                logger.warning("Simkl request failed (%s), retry %d/%d", reason, attempt + 1, self.max_retries)
+                await asyncio.sleep(delay)
+
+        self.counters["failures"] += 1
+        raise SimklUnavailable(f"Simkl request failed after {self.max_retries + 1} attempts ({reason})")
+
+
+client = SimklClient.from_env()
+metrics.register_gauges("simkl_client", lambda: client.stats())
+
 
+###########################################
+# --------------) Requests (--------------#
+###########################################
 
 def log_media(media: Movie | Show):
-    json_data = json.dumps(media.model_dump(), indent=4, default=str)
-    logger.info(f"Getting {media.title}\n{json_data}")
+    logger.debug("Getting %s\n%s", media.title, LazyJson(media))
 
 
-async def fetch(session: aiohttp.ClientSession, url: str) -> dict:
+async def api_request(endpoint: str) -> bytes:
     try:
-        async with session.get(url) as response:
-            response.raise_for_status()
-            return await response.json()
-    except aiohttp.ClientError as e:
-        logger.error(f"HTTP error occurred: {e}")
-        return {}
-
-
-async def api_request(endpoint: str):
-    url = API_URL + endpoint
-    async with aiohttp.ClientSession() as session:
-        return await fetch(session, url)
-
-
-async def search(media_type: str, search_string: str) -> list[dict[str, str]]:
-    _media_type = media_type.replace("s", "") if media_type in ["movies", "tv"] else "movie"
-    search_id = f'{search_string.replace(" ", "_")}_{_media_type}'
-
-    if search_id in cache:
-        logger.info(f"Cache hit for: {search_id}")
-        return cache[search_id]
-
-    logger.info(f"Searching Simkl for: {search_string}")
-    results = await api_request(f'/search/{_media_type}?&q={search_string}&client_id={CLIENT_ID}')
-    autocomplete = [
-        {
-            "name": f'{result["title"] if len(result["title"]) <= 75 else (result["title"][:72] + "...")} '
-                    f'({result.get("year", 0)})',
-            "value": result["ids"]["simkl_id"]
-        }
-        for result in results
-        if result.get("year", 0)
-    ]
-
-    cache[search_id] = autocomplete
+        return await client.get_raw(endpoint)
+    except SimklUnavailable as e:
+        logger.error(e)
+        return b""
+
+
+async def search_upstream(_media_type: str, search_string: str, search_id: str) -> list[dict[str, str]]:
+    logger.info("Searching Simkl for: %s", search_string)
+    search_counters["upstream"] += 1
+    try:
+        results = await client.get(f'/search/{_media_type}?&q={search_string}&limit={SEARCH_LIMIT}'
+                                   f'&client_id={CLIENT_ID}')
+    except SimklUnavailable as e:
+        # Not cached, so the next keystroke tries again once Simkl recovers
+        logger.error(e)
+        return []
+    autocomplete = [search_choice(result["title"], result["year"], result["ids"]["simkl_id"])
+                    for result in results if result.get("year", 0)]
+
+    # A short page holds every match, so any longer query can be answered from it without asking again
+    await search_cache.put(search_id, autocomplete, len(results) < SEARCH_LIMIT)
     return autocomplete
 
 
-async def id_to_object(media_type: str, simkl_id: int) -> Movie | Show | None:
-    data = await api_request(f'/{media_type}/{simkl_id}?extended=full&client_id={CLIENT_ID}')
+def single_flight(_media_type: str, search_string: str, search_id: str) -> asyncio.Task:
+    task = inflight_searches.get(search_id)
+    if task is not None:
+        search_counters["coalesced"] += 1
+        return task
+
+    task = asyncio.create_task(search_upstream(_media_type, search_string, search_id))
+    inflight_searches[search_id] = task
+    task.add_done_callback(lambda _: inflight_searches.pop(search_id, None))
+    return task
+
+
+def search_choice(title: str, year: int | None, simkl_id: int) -> dict[str, str]:
+    name = title if len(title) <= 75 else (title[:72] + "...")
+    return {"name": f'{name} ({year})' if year else name, "value": simkl_id}
+
+
+def search_type(media_type: str) -> str:
+    return media_type.replace("s", "") if media_type in ["movies", "tv"] else "movie"
+
+
+def search_key(_media_type: str, search_string: str) -> str:
+    return f'{search_string.replace(" ", "_")}_{_media_type}'
+
+
+def refine(_media_type: str, search_string: str) -> tuple[list[dict[str, str]], bool] | None:
+    # Narrow the longest cached prefix to the titles where every typed word still starts a word,
+    # ranking titles that start with the whole query first and otherwise keeping Simkl's order
+    for end in range(len(search_string) - 1, 1, -1):
+        cached = search_cache.peek(search_key(_media_type, search_string[:end]))
+        if cached is None:
+            continue
+
+        results, complete = cached
+        tokens = search_string.split()
+        ranked = []
+        for position, choice in enumerate(results):
+            words = re.sub('[^a-z0-9?! ]', '', choice["name"].lower()).split()
+            if all(any(word.startswith(token) for word in words) for token in tokens):
+                ranked.append((not " ".join(words).startswith(search_string), position, choice))
+        return [choice for *_, choice in sorted(ranked)], complete
+
+    return None
+
+
+def cached_choices(media_type: str, search_string: str) -> list[dict[str, str]]:
+    # Whatever memory holds for this query right now, however partial, for answers that cannot wait for Simkl
+    _media_type = search_type(media_type)
+    cached = search_cache.peek(search_key(_media_type, search_string)) or refine(_media_type, search_string)
+    return cached[0][:MAX_CHOICES] if cached else []
+
+
+async def search(media_type: str, search_string: str, user_id: int | None = None) -> list[dict[str, str]] | None:
+    _media_type = search_type(media_type)
+    search_id = search_key(_media_type, search_string)
+
+    cached = await search_cache.get(search_id)
+    if cached is not None:
+        logger.debug("Cache hit for: %s", search_id)
+        metrics.increment("search_cache", result="hit")
+        return cached[:MAX_CHOICES]
+
+    refined = refine(_media_type, search_string) if PREFIX_REFINEMENT else None
+    if refined and refined[0]:
+        choices = refined[0]
+        search_counters["refined"] += 1
+        metrics.increment("search_cache", result="refined")
+        # Refinement only approximates Simkl's matching and ranking (hyphens, split words, relevance), even from a
+        # complete page, so the real answer is always fetched in the background and replaces it in the cache
+        search_counters["refined_upstream"] += 1
+        single_flight(_media_type, search_string, search_id)
+        return choices[:MAX_CHOICES]
+    metrics.increment("search_cache", result="miss")
+
+    # The upstream task is shielded so dropping a superseded waiter never cancels a shared request
+    waiter = asyncio.ensure_future(asyncio.shield(single_flight(_media_type, search_string, search_id)))
+    if user_id is None:
+        return (await waiter)[:MAX_CHOICES]
+
+    generation, previous = user_searches.get(user_id, (0, None))
+    if previous is not None and not previous.done():
+        previous.cancel()
+        search_counters["cancelled"] += 1
+    user_searches[user_id] = generation + 1, waiter
+
+    try:
+        return (await waiter)[:MAX_CHOICES]
+    except asyncio.CancelledError:
+        if user_searches.get(user_id, (0, None))[0] != generation + 1:
+            return None
+        raise
+    finally:
+        if user_searches.get(user_id, (0, None))[1] is waiter:
+            del user_searches[user_id]
+
+
+def detail_endpoint(media_type: str, simkl_id: int) -> str:
+    return f'/{media_type}/{simkl_id}?extended=full&client_id={CLIENT_ID}'
+
+
+async def id_to_object(media_type: str, simkl_id: int, fresh: bool = False) -> Movie | Show | None:
+    lookup = detail_cache.refresh if fresh else detail_cache.get
+    data = await lookup(media_type, simkl_id, lambda: api_request(detail_endpoint(media_type, simkl_id)))
 
     try:
         if media_type == "tv":
-            media = Show.model_validate(data)
+            media = Show.model_validate_json(data)
         else:
-            media = Movie.model_validate(data)
+            media = Movie.model_validate_json(data)
 
         log_media(media)
         return media
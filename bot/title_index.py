@@ -0,0 +1,218 @@
+import re
+import sys
+import heapq
+from bisect import bisect_left, insort
+
+TO_WATCH = ("watched", False)
+MAX_RESULTS = 25
+
+
+def normalize(title: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", title.casefold()).split())
+
+
+def owner(user_id: int) -> tuple[str, int]:
+    return "owner", int(user_id)
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+###########################################
+# ---------------) Entry (----------------#
+###########################################
+
+class IndexEntry:
+    __slots__ = ("simkl_id", "title", "normalized", "user_id", "watched")
+
+    def __init__(self, simkl_id: int, title: str, user_id: int, watched: bool):
+        self.simkl_id = simkl_id
+        self.title = title
+        self.normalized = normalize(title)
+        self.user_id = int(user_id)
+        self.watched = bool(watched)
+
+    @property
+    def partitions(self) -> tuple[tuple, tuple]:
+        return ("watched", self.watched), owner(self.user_id)
+
+    def as_row(self) -> tuple[int, str, int, bool]:
+        return self.simkl_id, self.title, self.user_id, self.watched
+
+
+###########################################
+# ------------) Title Index (-------------#
+###########################################
+
+class TitleIndex:
+    def __init__(self):
+        self.entries: dict[int, IndexEntry] = {}
+        self.sorted_titles: list[tuple[str, int]] = []
+        self.tokens: dict[str, set[int]] = {}
+        self.sorted_tokens: list[str] = []
+        # Substring lookups intersect these instead of scanning every title, like the FTS5 trigram table
+        self.trigrams: dict[str, set[int]] = {}
+        self.partitions: dict[tuple, set[int]] = {}
+
+    def load(self, rows: list[tuple]) -> None:
+        self.__init__()
+        for simkl_id, title, user_id, watched_at in rows:
+            self.add(simkl_id, title, user_id, bool(watched_at))
+
+    def add(self, simkl_id: int, title: str, user_id: int, watched: bool = False) -> None:
+        if simkl_id in self.entries:
+            self.remove(simkl_id)
+
+        entry = IndexEntry(simkl_id, title, user_id, watched)
+        self.entries[simkl_id] = entry
+        insort(self.sorted_titles, (entry.normalized, simkl_id))
+
+        for token in set(entry.normalized.split()):
+            if token not in self.tokens:
+                self.tokens[token] = set()
+                insort(self.sorted_tokens, token)
+            self.tokens[token].add(simkl_id)
+
+        for gram in trigrams(entry.normalized):
+            self.trigrams.setdefault(gram, set()).add(simkl_id)
+
+        for partition in entry.partitions:
+            self.partitions.setdefault(partition, set()).add(simkl_id)
+
+    def remove(self, simkl_id: int, user_id: int | None = None) -> None:
+        entry = self.entries.get(simkl_id)
+        if entry is None or (user_id is not None and entry.user_id != int(user_id)):
+            return
+
+        del self.entries[simkl_id]
+        self.sorted_titles.pop(bisect_left(self.sorted_titles, (entry.normalized, simkl_id)))
+
+        for token in set(entry.normalized.split()):
+            ids = self.tokens[token]
+            ids.discard(simkl_id)
+            if not ids:
+                del self.tokens[token]
+                self.sorted_tokens.pop(bisect_left(self.sorted_tokens, token))
+
+        for gram in trigrams(entry.normalized):
+            ids = self.trigrams[gram]
+            ids.discard(simkl_id)
+            if not ids:
+                del self.trigrams[gram]
+
+        for partition in entry.partitions:
+            self.partitions[partition].discard(simkl_id)
+
+    def set_watched(self, simkl_id: int) -> None:
+        entry = self.entries.get(simkl_id)
+        if entry is None or entry.watched:
+            return
+
+        self.partitions[("watched", False)].discard(simkl_id)
+        entry.watched = True
+        self.partitions.setdefault(("watched", True), set()).add(simkl_id)
+
+    def _token_matches(self, prefix: str) -> set[int]:
+        matches = set()
+        for i in range(bisect_left(self.sorted_tokens, prefix), len(self.sorted_tokens)):
+            token = self.sorted_tokens[i]
+            if not token.startswith(prefix):
+                break
+            matches |= self.tokens[token]
+        return matches
+
+    def _substring_matches(self, query: str, allowed: set[int]) -> set[int]:
+        # Queries shorter than a trigram are left to the token prefixes; one or two letters mid-word is noise
+        if len(query) < 3:
+            return set()
+
+        postings = sorted((self.trigrams.get(gram, set()) for gram in trigrams(query)), key=len)
+        matches = postings[0] & allowed
+        for ids in postings[1:]:
+            if not matches:
+                break
+            matches &= ids
+        return {simkl_id for simkl_id in matches if query in self.entries[simkl_id].normalized}
+
+    def search(self, search_string: str, partition: tuple, limit: int = MAX_RESULTS) -> list[dict]:
+        allowed = self.partitions.get(partition, set())
+        query = normalize(search_string)
+        words = query.split()
+
+        if not words:
+            ids = [simkl_id for _, simkl_id in self.sorted_titles if simkl_id in allowed][:limit]
+            return self._choices(ids)
+
+        candidates = set(allowed)
+        for word in words:
+            candidates &= self._token_matches(word)
+            if not candidates:
+                break
+
+        # Top up with substring matches only when token prefixes come up short
+        if len(candidates) < limit:
+            candidates |= self._substring_matches(query, allowed)
+
+        ranked = heapq.nsmallest(
+            limit, candidates,
+            key=lambda simkl_id: (not self.entries[simkl_id].normalized.startswith(query),
+                                  len(self.entries[simkl_id].normalized), self.entries[simkl_id].normalized)
+        )
+        return self._choices(ranked)
+
+    def _choices(self, ids: list[int]) -> list[dict]:
+        return [
+            {
+                "name": self.entries[simkl_id].title,
+                "value": simkl_id
+            }
+            for simkl_id in ids
+        ]
+
+    def verify(self, rows: list[tuple]) -> dict[str, list[int]]:
+        expected = {simkl_id: (simkl_id, title, int(user_id), bool(watched_at))
+                    for simkl_id, title, user_id, watched_at in rows}
+        return {
+            "missing": sorted(expected.keys() - self.entries.keys()),
+            "extra": sorted(self.entries.keys() - expected.keys()),
+            "stale": sorted(simkl_id for simkl_id in expected.keys() & self.entries.keys()
+                            if self.entries[simkl_id].as_row() != expected[simkl_id])
+        }
+
+    def footprint(self) -> int:
+        size = sum(map(sys.getsizeof, (self.entries, self.sorted_titles, self.tokens, self.sorted_tokens,
+                                       self.trigrams, self.partitions)))
+        for entry in self.entries.values():
+            size += sys.getsizeof(entry) + sys.getsizeof(entry.title) + sys.getsizeof(entry.normalized)
+        size += sum(sys.getsizeof(item) for item in self.sorted_titles)
+        size += sum(sys.getsizeof(token) + sys.getsizeof(ids) for token, ids in self.tokens.items())
+        size += sum(sys.getsizeof(gram) + sys.getsizeof(ids) for gram, ids in self.trigrams.items())
+        size += sum(sys.getsizeof(ids) for ids in self.partitions.values())
+        return size
+
+
+indexes: dict[tuple[int, str], TitleIndex] = {}
+
+
+def index_for(guild_id: int, table_name: str) -> TitleIndex:
+    key = int(guild_id), table_name
+    if key not in indexes:
+        indexes[key] = TitleIndex()
+    return indexes[key]
+
+
+def load(table_name: str, rows: list[tuple]) -> None:
+    guild_rows: dict[int, list[tuple]] = {}
+    for guild_id, *row in rows:
+        guild_rows.setdefault(guild_id, []).append(row)
+
+    for (guild_id, name), index in indexes.items():
+        if name == table_name and guild_id not in guild_rows:
+            index.load([])
+    for guild_id, rows in guild_rows.items():
+        index_for(guild_id, table_name).load(rows)
+
+
+if __name__ == '__main__':
+    pass
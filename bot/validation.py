@@ -1,5 +1,6 @@
 from humanize import intword
 from datetime import datetime
+from functools import cached_property
 from typing import Optional, Union
 from pydantic import BaseModel, field_validator
 
@@ -91,26 +92,27 @@ class Media(BaseModel):
     def default_integers(cls, v):
         return v or 0
 
-    @property
+    # Derived values are computed on first use, then reused by inserts, list rows and embeds
+    @cached_property
     def imdb_rating(self):
         try:
             return self.ratings.imdb.rating
         except AttributeError:
             return 0.0
 
-    @property
+    @cached_property
     def printable_imdb_rating(self):
         if self.imdb_rating:
             return f"★ {self.imdb_rating:.1f}"
         return "★ N/A"
 
-    @property
+    @cached_property
     def printable_runtime(self):
         if self.runtime:
             return convert_minutes(self.runtime)
         return "N/A"
 
-    @property
+    @cached_property
     def printable_genres(self):
         if self.genres:
             return ", ".join(self.genres)
@@ -127,20 +129,20 @@ class Movie(Media):
     budget: Optional[int]
     revenue: Optional[int]
 
-    @property
+    @cached_property
     def release_timestamp(self):
         try:
             return convert_to_unix(self.released, "%Y-%m-%d")
         except ValueError:
             return 0
 
-    @property
+    @cached_property
     def printable_budget(self):
         if isinstance(self.budget, int):
             return f"${intword(self.budget)}"
         return "N/A"
 
-    @property
+    @cached_property
     def printable_revenue(self):
         if isinstance(self.revenue, int):
             return f"${intword(self.revenue)}"
@@ -161,14 +163,14 @@ class Show(Media):
     status: Optional[str]
     network: Optional[str]
 
-    @property
+    @cached_property
     def release_timestamp(self):
         try:
             return convert_to_unix(self.first_aired, "%Y-%m-%dT%H:%M:%S%z")
         except ValueError:
             return 0
 
-    @property
+    @cached_property
     def printable_status(self):
         if self.status and self.status != "tba":
             return self.status.title()